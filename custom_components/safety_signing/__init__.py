@@ -2,11 +2,60 @@
 from __future__ import annotations
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+import asyncio
 import json
 import logging
-from .token import Token
-from .const import DOMAIN, API_IP
+from .api import async_close_clients, async_get_client
+from .auth import AccessTokenManager
+from .history import async_get_history
+from .image_store import async_get_image_store
+from .offline import async_get_offline_queue
+from .publisher import async_get_publisher
+from .ratelimit import async_get_rate_limiter
+from .retry import RetryPolicy
+from .schedule import async_get_timer_wheel
+from .scheduler import async_get_scheduler
+from .services import async_setup_services
+from .store import async_get_validation_store
+from .token import Token, TokenGroup, clean_tax_ids, make_cron_id, token_configs
+from .const import (
+    API_IP,
+    CONF_API_SOCKET,
+    CONF_APP_CONCURRENCY,
+    CONF_APP_LIMITS,
+    CONF_CLIENT_ID,
+    CONF_CLIENT_SECRET,
+    CONF_CONNECT_TIMEOUT,
+    CONF_MAX_REQUESTS,
+    CONF_RATE_BURST,
+    CONF_RATE_LIMIT,
+    CONF_READ_TIMEOUT,
+    CONF_RETRY_ATTEMPTS,
+    CONF_RETRY_BASE_DELAY,
+    CONF_RETRY_MAX_DELAY,
+    CONF_SPLIT_APPS,
+    CONF_STATE_WRITE_INTERVAL,
+    CONF_TOKEN_URL,
+    DEFAULT_APP_CONCURRENCY,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_MAX_REQUESTS,
+    DEFAULT_RATE_BURST,
+    DEFAULT_RATE_LIMIT,
+    DEFAULT_READ_TIMEOUT,
+    DEFAULT_RETRY_ATTEMPTS,
+    DEFAULT_RETRY_BASE_DELAY,
+    DEFAULT_RETRY_MAX_DELAY,
+    DEFAULT_STATE_WRITE_INTERVAL,
+    DEFAULT_TOKEN_URL,
+    DATA_HISTORY,
+    DATA_PUBLISHER,
+    DATA_RATE_LIMITERS,
+    DATA_SCHEDULER,
+    DATA_TIMER_WHEEL,
+    DOMAIN,
+    IMAGE_HASH,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -22,36 +71,132 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     api_ip_address = API_IP
     try:
         input_config = json.loads(entry.data["json_config"])
-        input_config["token_serial"]
-        input_config["serial_number"]
-        input_config["pin"]
-        input_config["access_token"] = json.dumps(input_config["access_token"])
-        input_config["app"]
-        input_config["tax_ids"]
-        pdf_options = ""
-        if "pdf_options" in input_config and len(input_config["pdf_options"]) >= 1:
-            pdf_options = json.dumps(input_config["pdf_options"])
+        input_config["access_token"]
+        configs = token_configs(input_config)
+        for config in configs:
+            config["token_serial"]
+            config["serial_number"]
+            config["pin"]
+            config["app"]
+            config["tax_ids"]
     except:
         """Input config error"""
         _LOGGER.exception("Unexpected exception")
         return True
 
-    tax_ids = []
-    if len(input_config["tax_ids"]) >= 1:
-        for tax_id in input_config["tax_ids"]:
-            if tax_id.replace("-", "").isnumeric() and len(tax_id.replace("-", "")) >= 10 and len(tax_id.replace("-", "")) <= 16:
-                tax_ids.append(tax_id.replace("-", ""))
-    
-    token = Token(hass, entry.data["name"], api_ip_address, pdf_options, json.dumps(tax_ids), input_config["token_serial"], input_config["serial_number"], input_config["access_token"], input_config["pin"], input_config["app"])
-    await token.check_serial_exists()
-    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = token
-    _LOGGER.info("Token ok")
+    migrated = False
+    for config in configs:
+        image = (config.get("pdf_options") or {}).get("image")
+        if isinstance(image, dict) and image.get("content"):
+            # Move the stamp image out of the entry, only its hash is kept and sent.
+            # Token configs share their dicts with input_config, so it is updated too
+            migrated = await async_get_image_store(hass).async_move(image) or migrated
+    if migrated:
+        hass.config_entries.async_update_entry(
+            entry, data={**entry.data, "json_config": json.dumps(input_config)}
+        )
+    entry.async_create_background_task(
+        hass, _async_remove_unused_images(hass), f"{DOMAIN} remove unused images"
+    )
+
+    # Every entry shares the same pooled client, the first one to load sets its tuning
+    client = async_get_client(
+        hass,
+        api_ip_address,
+        connect_timeout=input_config.get(CONF_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=input_config.get(CONF_READ_TIMEOUT, DEFAULT_READ_TIMEOUT),
+        max_requests=input_config.get(CONF_MAX_REQUESTS, DEFAULT_MAX_REQUESTS),
+        socket_path=input_config.get(CONF_API_SOCKET),
+    )
+
+    rate_limiter = async_get_rate_limiter(
+        hass,
+        api_ip_address,
+        rate=input_config.get(CONF_RATE_LIMIT, DEFAULT_RATE_LIMIT),
+        burst=input_config.get(CONF_RATE_BURST, DEFAULT_RATE_BURST),
+    )
+
+    async_get_publisher(
+        hass,
+        interval=input_config.get(CONF_STATE_WRITE_INTERVAL, DEFAULT_STATE_WRITE_INTERVAL),
+    )
+
+    @callback
+    def _async_persist_access_token(access_token: dict) -> None:
+        config = json.loads(entry.data["json_config"])
+        config["access_token"] = access_token
+        hass.config_entries.async_update_entry(
+            entry, data={**entry.data, "json_config": json.dumps(config)}
+        )
+
+    # The access token belongs to the entry, every token of the entry signs with it
+    auth = AccessTokenManager(
+        hass,
+        input_config["access_token"],
+        _async_persist_access_token,
+        token_url=input_config.get(CONF_TOKEN_URL, DEFAULT_TOKEN_URL),
+        client_id=input_config.get(CONF_CLIENT_ID),
+        client_secret=input_config.get(CONF_CLIENT_SECRET),
+    )
+    auth.async_start()
+    entry.async_on_unload(auth.async_stop)
+
+    retry_policy = RetryPolicy(
+        attempts=input_config.get(CONF_RETRY_ATTEMPTS, DEFAULT_RETRY_ATTEMPTS),
+        base_delay=input_config.get(CONF_RETRY_BASE_DELAY, DEFAULT_RETRY_BASE_DELAY),
+        max_delay=input_config.get(CONF_RETRY_MAX_DELAY, DEFAULT_RETRY_MAX_DELAY),
+    )
+    validation_store = await async_get_validation_store(hass)
+    offline_queue = await async_get_offline_queue(hass)
+    # Like the client tuning, an app limit is set by the first entry that has one
+    async_get_scheduler(hass).set_app_limits(input_config.get(CONF_APP_LIMITS) or {})
+
+    tokens = [
+        Token(hass, entry.data["name"], api_ip_address, config.get("pdf_options") or {}, clean_tax_ids(config["tax_ids"]), config["token_serial"], config["serial_number"], input_config["access_token"], config["pin"], config["app"], client, validation_store=validation_store, auth=auth, retry_policy=retry_policy, schedule=config.get("schedule"), split_apps=bool(config.get(CONF_SPLIT_APPS)), app_concurrency=config.get(CONF_APP_CONCURRENCY, DEFAULT_APP_CONCURRENCY), history=async_get_history(hass), rate_limiter=rate_limiter, offline_queue=offline_queue)
+        # Options set through the options flow take over the json config
+        for config in ({**config, **entry.options} for config in configs)
+    ]
+    group = TokenGroup(tokens)
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = group
+
+    # Crons with a built-in schedule share one timer for every entry
+    wheel = async_get_timer_wheel(hass)
+    for cron in group.crons:
+        if cron.schedule is not None:
+            entry.async_on_unload(
+                wheel.async_schedule(cron.cron_id, cron.schedule, cron.scheduled_run)
+            )
 
     # hass.data.setdefault(DOMAIN, {})[entry.entry_id] = token.Token(hass, entry.data["name"], entry.data["token_serial"], entry.data["serial_number"], entry.data["access_token"], entry.data["pin"], entry.data["app"]) if entry.entry_id not in hass.data.setdefault(DOMAIN, {}).keys() else False
 
+    async_setup_services(hass)
+
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
+
     # This creates each HA object for each platform your device requires.
     # It's done by calling the `async_setup_entry` function in each platform module.
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    # Runs queued while the API was unreachable are replayed whenever it is back
+    @callback
+    def _async_replay() -> None:
+        if client.available:
+            for token in group.tokens:
+                entry.async_create_background_task(
+                    hass, token.async_replay(), f"{DOMAIN} replay {token.token_id}"
+                )
+
+    entry.async_on_unload(client.async_add_listener(_async_replay))
+
+    async def _async_start() -> None:
+        await group.async_revalidate()
+        _async_replay()
+
+    # Entities start from the last known validation result, the API is only asked
+    # once they exist so a slow or missing API does not hold up startup
+    entry.async_create_background_task(
+        hass, _async_start(), f"{DOMAIN} revalidate {entry.entry_id}"
+    )
     # hass.async_create_task(
     #     hass.config_entries.async_forward_entry_setup(
     #         ConfigEntry, "cover"
@@ -60,6 +205,44 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return True
 
 
+async def _async_remove_unused_images(
+    hass: HomeAssistant, removed: ConfigEntry | None = None
+) -> None:
+    """Delete the stamp images no entry uses any more, `removed` aside."""
+    used = set()
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        if entry is removed:
+            continue
+        try:
+            configs = token_configs(json.loads(entry.data["json_config"]))
+        except (KeyError, TypeError, ValueError):
+            # The images of that entry are unknown, keep everything
+            return
+        for config in (*configs, entry.options):
+            image = (config.get("pdf_options") or {}).get("image")
+            if isinstance(image, dict) and image.get(IMAGE_HASH):
+                used.add(image[IMAGE_HASH])
+    await async_get_image_store(hass).async_remove_unused(used)
+
+
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply the entry options to the live tokens, without reloading the entry.
+
+    Also called on every other entry update, like a refreshed access token, in
+    which case nothing changes.
+    """
+    if (group := hass.data.get(DOMAIN, {}).get(entry.entry_id)) is None:
+        return
+    configs = token_configs(json.loads(entry.data["json_config"]))
+    for token, config in zip(group.tokens, configs):
+        config = {**config, **entry.options}
+        token.async_apply_options(
+            config.get("pdf_options") or {}, clean_tax_ids(config["tax_ids"]), config["app"]
+        )
+    # The options may have replaced the stamp image
+    await _async_remove_unused_images(hass)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     # This is called when an entry/configured device is to be removed. The class
@@ -67,6 +250,37 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # details
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        group = hass.data[DOMAIN].pop(entry.entry_id)
+        # Log out of the tokens before their client may be closed below
+        await asyncio.gather(*(token.async_close() for token in group.tokens))
+        if not any(isinstance(value, TokenGroup) for value in hass.data[DOMAIN].values()):
+            # Last entry gone, stop the workers and release the pooled connections
+            if (wheel := hass.data[DOMAIN].pop(DATA_TIMER_WHEEL, None)) is not None:
+                wheel.async_stop()
+            if (scheduler := hass.data[DOMAIN].pop(DATA_SCHEDULER, None)) is not None:
+                await scheduler.async_shutdown()
+            await async_close_clients(hass)
+            hass.data[DOMAIN].pop(DATA_RATE_LIMITERS, None)
+            if (publisher := hass.data[DOMAIN].pop(DATA_PUBLISHER, None)) is not None:
+                publisher.async_stop()
+            if (history := hass.data[DOMAIN].pop(DATA_HISTORY, None)) is not None:
+                await history.async_close()
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Forget the stored validation results, waiting runs and images of a removed entry."""
+    try:
+        configs = token_configs(json.loads(entry.data["json_config"]))
+        serials = [(config["token_serial"], config["serial_number"]) for config in configs]
+        name = entry.data["name"]
+    except (KeyError, TypeError, ValueError):
+        return
+    store = await async_get_validation_store(hass)
+    offline_queue = await async_get_offline_queue(hass)
+    for token_serial, serial_number in serials:
+        store.remove(token_serial, serial_number)
+        # Other entries may share the token serial, only the runs of this one go
+        offline_queue.clear(token_serial.upper(), [make_cron_id(name, serial_number)])
+    await _async_remove_unused_images(hass, removed=entry)
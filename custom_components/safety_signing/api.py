@@ -0,0 +1,408 @@
+"""Async client speaking with the local SAFEcert signing API."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+import json
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+import aiohttp
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import (
+    API_PORT,
+    DATA_CLIENTS,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_KEEPALIVE,
+    DEFAULT_MAX_REQUESTS,
+    DEFAULT_READ_TIMEOUT,
+    DOMAIN,
+    HEARTBEAT_PATH,
+    HEARTBEAT_TIMEOUT,
+    TRACE_BUFFER_SIZE,
+)
+from .health import STATE_OPEN, CircuitBreaker, Heartbeat
+from .progress import ProgressStream
+from .traces import RequestTrace, trace_config
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds between pings keeping the progress websocket alive
+WS_HEARTBEAT = 30
+
+# HTTP statuses meaning the API is overloaded or restarting, worth a retry
+BUSY_STATUSES = {429, 502, 503, 504}
+
+# Answer with one json object per line, the API streams large results this way
+NDJSON = "application/x-ndjson"
+
+_T = TypeVar("_T")
+
+
+class ApiError(HomeAssistantError):
+    """Base error of the calls to the signing API."""
+
+
+class ApiConnectionError(ApiError):
+    """Error to indicate the signing API could not be reached or timed out."""
+
+
+class ApiBusyError(ApiConnectionError):
+    """Error to indicate the API answered it can not take the request right now."""
+
+
+class ApiUnavailableError(ApiConnectionError):
+    """Error to indicate a request was refused because the API is known to be down."""
+
+
+class ApiNotFoundError(ApiConnectionError):
+    """Error to indicate the API does not serve the requested path."""
+
+
+class ApiResponseError(ApiError):
+    """Error to indicate the API answered with an error status or an unreadable body.
+
+    The API did get the request, sending it again could sign twice.
+    """
+
+
+class ApiLoginError(ApiError):
+    """Error to indicate the API refused to log into a token, like for a wrong PIN.
+
+    Never retried nor replayed, repeated logins with a wrong PIN lock the token.
+    """
+
+
+class ApiClient:
+    """Pooled HTTP client for one signing API host.
+
+    The aiohttp session keeps connections to the API alive between calls and
+    the semaphore caps how many requests are in flight at the same time. A circuit
+    breaker fed by the requests and by a background heartbeat makes calls fail
+    fast while the API is down.
+
+    With a `socket_path` every request tries that Unix socket first. A request
+    that can not connect to it, like while the signing service restarts, is
+    sent again over TCP, the next one tries the socket again.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = API_PORT,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        max_requests: int = DEFAULT_MAX_REQUESTS,
+        socket_path: str | None = None,
+    ) -> None:
+        """Init client, the session itself is opened on first use."""
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.max_requests = max_requests
+        self._base_url = f"http://{host}:{port}"
+        self._timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self._semaphore = asyncio.Semaphore(max_requests)
+        # Pooled sessions by transport, unix and tcp
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+        # The last request could not connect to the socket, only to log the changes
+        self._socket_down = False
+        self._listeners: list[CALLBACK_TYPE] = []
+        self._breaker = CircuitBreaker(self._async_notify_listeners)
+        self._heartbeat: Heartbeat | None = None
+        self._last_success = 0.0
+        self.progress = ProgressStream(self)
+        # Timings of the last requests, dumped by the diagnostics
+        self.traces: deque[RequestTrace] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+    @property
+    def transport(self) -> str:
+        """Return the transport the last request went through, unix or tcp."""
+        return "unix" if self.socket_path is not None and not self._socket_down else "tcp"
+
+    def _get_session(self, tcp: bool = False) -> aiohttp.ClientSession:
+        transport = "tcp" if tcp or self.socket_path is None else "unix"
+        session = self._sessions.get(transport)
+        if session is None or session.closed:
+            connector: aiohttp.BaseConnector
+            if transport == "unix":
+                # Urls keep the host and port, the connector ignores them
+                connector = aiohttp.UnixConnector(
+                    path=self.socket_path,
+                    limit=self.max_requests,
+                    keepalive_timeout=DEFAULT_KEEPALIVE,
+                )
+            else:
+                connector = aiohttp.TCPConnector(
+                    limit=self.max_requests, keepalive_timeout=DEFAULT_KEEPALIVE
+                )
+            session = self._sessions[transport] = aiohttp.ClientSession(
+                connector=connector, timeout=self._timeout, trace_configs=[trace_config()]
+            )
+        return session
+
+    def url(self, path: str) -> str:
+        """Return the full url of an API path."""
+        return self._base_url + path
+
+    @property
+    def available(self) -> bool:
+        """Return False while the circuit breaker considers the API down."""
+        return self._breaker.state != STATE_OPEN
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Call `update_callback` when availability changes, return a remover."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def _async_notify_listeners(self) -> None:
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    def _record_success(self) -> None:
+        self._last_success = time.monotonic()
+        self._breaker.record_success()
+
+    async def post(
+        self,
+        path: str,
+        body: dict[str, Any] | bytes,
+        headers: dict[str, str] | None = None,
+        queue_wait: float = 0.0,
+    ) -> dict[str, Any]:
+        """POST a json body to the API and return the decoded json answer.
+
+        `queue_wait` is the time the caller waited for the rate limiter, traced
+        with the request.
+        """
+        return await self._request(
+            path, body, headers, lambda response: response.json(content_type=None), queue_wait
+        )
+
+    async def post_stream(
+        self,
+        path: str,
+        body: dict[str, Any] | bytes,
+        on_record: Callable[[dict[str, Any]], None],
+        headers: dict[str, str] | None = None,
+        queue_wait: float = 0.0,
+    ) -> dict[str, Any]:
+        """POST a json body and read the answer as it arrives.
+
+        An NDJSON answer is parsed line by line: lines holding a `document` are
+        handed to `on_record`, the other lines are merged into the returned answer,
+        so memory does not grow with the number of documents. An API answering
+        plain json is read in full, its `data.documents` are handed over the same way.
+        """
+
+        async def read(response: aiohttp.ClientResponse) -> dict[str, Any]:
+            if response.content_type != NDJSON:
+                full = await response.json(content_type=None)
+                if isinstance(full, dict) and isinstance(full.get("data"), dict):
+                    for record in full["data"].pop("documents", None) or []:
+                        on_record(record)
+                return full
+            answer: dict[str, Any] = {}
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "document" in item:
+                    on_record(item["document"])
+                    continue
+                if isinstance(item.get("data"), dict):
+                    answer.setdefault("data", {}).update(item.pop("data"))
+                answer.update(item)
+            return answer
+
+        return await self._request(
+            path, body, {"Accept": f"{NDJSON}, application/json", **(headers or {})}, read, queue_wait
+        )
+
+    def _is_socket_error(self, err: BaseException | None, tcp: bool = False) -> bool:
+        """Return True if `err` means the Unix socket could not be connected to."""
+        return (
+            not tcp
+            and self.socket_path is not None
+            and isinstance(err, aiohttp.ClientConnectorError)
+        )
+
+    def _set_socket_down(self, down: bool, err: BaseException | None = None) -> None:
+        if down == self._socket_down:
+            return
+        self._socket_down = down
+        if down:
+            _LOGGER.warning(
+                "Could not connect to signing API socket %s, using TCP on %s:%s until it is back: %r",
+                self.socket_path, self.host, self.port, err,
+            )
+        else:
+            _LOGGER.info("Signing API socket %s is back", self.socket_path)
+
+    async def _request(
+        self,
+        path: str,
+        body: dict[str, Any] | bytes,
+        headers: dict[str, str] | None,
+        read: Callable[[aiohttp.ClientResponse], Awaitable[_T]],
+        queue_wait: float = 0.0,
+    ) -> _T:
+        try:
+            return await self._async_request(path, body, headers, read, queue_wait)
+        except ApiConnectionError as err:
+            if not self._is_socket_error(err.__cause__):
+                raise
+            self._set_socket_down(True, err.__cause__)
+        # The wait was for this request, the retry over TCP reports it as well
+        return await self._async_request(path, body, headers, read, queue_wait, tcp=True)
+
+    async def _async_request(
+        self,
+        path: str,
+        body: dict[str, Any] | bytes,
+        headers: dict[str, str] | None,
+        read: Callable[[aiohttp.ClientResponse], Awaitable[_T]],
+        queue_wait: float = 0.0,
+        tcp: bool = False,
+    ) -> _T:
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        trace = RequestTrace("POST", path, sent_bytes=len(body), rate_limit_wait=queue_wait)
+        trace.mark("queued")
+        try:
+            if not self._breaker.allow():
+                raise ApiUnavailableError(f"Signing API at {self.host} is unavailable")
+            async with self._semaphore:
+                trace.mark("acquired")
+                try:
+                    async with self._get_session(tcp).post(
+                        self.url(path),
+                        data=body,
+                        headers={"Content-Type": "application/json", **(headers or {})},
+                        trace_request_ctx=trace,
+                    ) as response:
+                        self._record_success()
+                        if not tcp and self.socket_path is not None:
+                            self._set_socket_down(False)
+                        trace.status = response.status
+                        if response.status in BUSY_STATUSES:
+                            raise ApiBusyError(f"Signing API busy: HTTP {response.status}")
+                        if response.status == 404:
+                            raise ApiNotFoundError(f"Signing API has no {path}")
+                        if response.status >= 400:
+                            raise ApiResponseError(
+                                f"Signing API answered HTTP {response.status}: "
+                                f"{(await response.text(errors='replace'))[:200]!r}"
+                            )
+                        result = await read(response)
+                        trace.mark("read")
+                        trace.received_bytes = response.content.total_bytes
+                        return result
+                except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                    # A missing socket says nothing of the API, the request goes on over TCP
+                    if not self._is_socket_error(err, tcp):
+                        self._breaker.record_failure()
+                    raise ApiConnectionError(
+                        f"Could not connect to API or timeout: {err!r}"
+                    ) from err
+                except ValueError as err:
+                    raise ApiResponseError(f"Invalid answer from API: {err!r}") from err
+        except ApiError as err:
+            trace.error = str(err)
+            raise
+        finally:
+            trace.mark("done")
+            self.traces.append(trace)
+
+    async def async_probe(self) -> bool:
+        """Return True if the API answers at all, whatever the status code."""
+        try:
+            await self._async_probe()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            if not self._is_socket_error(err):
+                return False
+            self._set_socket_down(True, err)
+            try:
+                await self._async_probe(tcp=True)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return False
+        return True
+
+    async def _async_probe(self, tcp: bool = False) -> None:
+        async with self._get_session(tcp).get(
+            self.url(HEARTBEAT_PATH),
+            timeout=aiohttp.ClientTimeout(total=HEARTBEAT_TIMEOUT),
+        ):
+            self._last_success = time.monotonic()
+            if not tcp and self.socket_path is not None:
+                self._set_socket_down(False)
+
+    async def async_ws_connect(self, path: str) -> aiohttp.ClientWebSocketResponse:
+        """Open a websocket to an API path on the pooled session."""
+        try:
+            return await self._get_session().ws_connect(self.url(path), heartbeat=WS_HEARTBEAT)
+        except aiohttp.ClientConnectorError as err:
+            if not self._is_socket_error(err):
+                raise
+            self._set_socket_down(True, err)
+        return await self._get_session(tcp=True).ws_connect(self.url(path), heartbeat=WS_HEARTBEAT)
+
+    @callback
+    def async_start_heartbeat(self, hass: HomeAssistant) -> None:
+        """Start probing the API in the background."""
+        if self._heartbeat is None:
+            self._heartbeat = Heartbeat(
+                hass, self.async_probe, self._breaker, lambda: self._last_success
+            )
+            self._heartbeat.async_start(self.host)
+
+    async def close(self) -> None:
+        """Stop the heartbeat and progress stream and close the pooled connections."""
+        await self.progress.close()
+        if self._heartbeat is not None:
+            await self._heartbeat.async_stop()
+            self._heartbeat = None
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+
+def async_get_client(hass: HomeAssistant, host: str, **options: Any) -> ApiClient:
+    """Return the client shared by every entry talking to `host`.
+
+    `options` are only used when the client does not exist yet.
+    """
+    clients: dict[str, ApiClient] = hass.data.setdefault(DOMAIN, {}).setdefault(
+        DATA_CLIENTS, {}
+    )
+    if host not in clients:
+        client = clients[host] = ApiClient(host, **options)
+        client.async_start_heartbeat(hass)
+
+        async def _async_close(_event) -> None:
+            await client.close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_close)
+    return clients[host]
+
+
+async def async_close_clients(hass: HomeAssistant) -> None:
+    """Close and forget every shared client."""
+    clients = hass.data.get(DOMAIN, {}).pop(DATA_CLIENTS, {})
+    for client in clients.values():
+        await client.close()
@@ -0,0 +1,169 @@
+"""Proactive refresh of the google access token sent with autoSign."""
+from __future__ import annotations
+
+from collections.abc import Callable
+import asyncio
+import logging
+import time
+from typing import Any
+
+import aiohttp
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.event import async_call_later
+
+from .const import (
+    DEFAULT_TOKEN_URL,
+    TOKEN_REFRESH_MARGIN,
+    TOKEN_REFRESH_MAX_RETRY,
+    TOKEN_REFRESH_RETRY,
+)
+from .singleflight import SingleFlight
+
+_LOGGER = logging.getLogger(__name__)
+
+# Key the expiry is kept under, in ms like google-auth-library does
+EXPIRY_DATE = "expiry_date"
+
+
+class AccessTokenManager:
+    """Keep the access token of one config entry fresh.
+
+    The token is refreshed `TOKEN_REFRESH_MARGIN` seconds before it expires, by a
+    timer and on demand. Concurrent callers share the same refresh request. Once
+    a refresh failed only the timer tries again, with a growing delay, so runs
+    do not wait on a token endpoint that is down or refusing. Nothing is
+    refreshed without a client id, the endpoint would refuse the request.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        access_token: dict[str, Any],
+        on_refresh: Callable[[dict[str, Any]], None],
+        token_url: str = DEFAULT_TOKEN_URL,
+        client_id: str | None = None,
+        client_secret: str | None = None,
+    ) -> None:
+        """Init manager, `on_refresh` is called with every new token to persist it."""
+        self._hass = hass
+        self._access_token = access_token
+        self._on_refresh = on_refresh
+        self._token_url = token_url
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self._refreshing: SingleFlight[dict[str, Any]] = SingleFlight()
+        self._unsub_timer: CALLBACK_TYPE | None = None
+        # Refreshes failed in a row
+        self._failures = 0
+
+    @property
+    def access_token(self) -> dict[str, Any]:
+        """Return the current token, fresh or not."""
+        return self._access_token
+
+    @property
+    def expires_at(self) -> float | None:
+        """Return the expiry as a timestamp, None when unknown."""
+        if (expiry := self._access_token.get(EXPIRY_DATE)) is None:
+            return None
+        return expiry / 1000
+
+    @property
+    def can_refresh(self) -> bool:
+        """Return True if the token can be refreshed with the configured client."""
+        return bool(self._access_token.get("refresh_token") and self._client_id)
+
+    def needs_refresh(self) -> bool:
+        """Return True if the token expires within the refresh margin."""
+        if not self.can_refresh:
+            return False
+        expires_at = self.expires_at
+        # A token loaded without expiry has an unknown age, refresh it once
+        return expires_at is None or expires_at - time.time() < TOKEN_REFRESH_MARGIN
+
+    async def async_get_access_token(self) -> dict[str, Any]:
+        """Return a token valid for at least the refresh margin when possible.
+
+        After a failed refresh the current token is returned as is until the
+        retry timer got a new one.
+        """
+        if self.needs_refresh() and not self._failures:
+            return await self._async_try_refresh()
+        return self._access_token
+
+    async def _async_try_refresh(self) -> dict[str, Any]:
+        """Refresh, arming the retry timer on failure, return the token to use."""
+        try:
+            return await self.async_refresh()
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as err:
+            self._failures += 1
+            delay = min(TOKEN_REFRESH_RETRY * 2 ** (self._failures - 1), TOKEN_REFRESH_MAX_RETRY)
+            _LOGGER.error("Could not refresh access token, retrying in %ss: %r", delay, err)
+            self.async_stop()
+            self._unsub_timer = async_call_later(self._hass, delay, self._async_timer_refresh)
+        return self._access_token
+
+    async def async_refresh(self) -> dict[str, Any]:
+        """Refresh the token, joining a refresh already in flight."""
+        return await self._refreshing.async_call(self._async_refresh)
+
+    async def _async_refresh(self) -> dict[str, Any]:
+        access_token = await self._async_request_token()
+        self._failures = 0
+        self._access_token = access_token
+        self._on_refresh(access_token)
+        self._schedule_refresh()
+        return access_token
+
+    async def _async_request_token(self) -> dict[str, Any]:
+        form = {
+            "grant_type": "refresh_token",
+            "refresh_token": self._access_token["refresh_token"],
+        }
+        if self._client_id:
+            form["client_id"] = self._client_id
+        if self._client_secret:
+            form["client_secret"] = self._client_secret
+
+        session = async_get_clientsession(self._hass)
+        async with session.post(
+            self._token_url, data=form, timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            response.raise_for_status()
+            result = await response.json(content_type=None)
+
+        # The refresh answer usually omits the refresh token, keep the known one
+        access_token = {**self._access_token, **result}
+        access_token[EXPIRY_DATE] = int((time.time() + int(result["expires_in"])) * 1000)
+        _LOGGER.debug("Access token refreshed, expires in %ss", result["expires_in"])
+        return access_token
+
+    @callback
+    def _schedule_refresh(self) -> None:
+        self.async_stop()
+        if (expires_at := self.expires_at) is None:
+            return
+        delay = max(expires_at - time.time() - TOKEN_REFRESH_MARGIN, 0)
+        self._unsub_timer = async_call_later(self._hass, delay, self._async_timer_refresh)
+
+    async def _async_timer_refresh(self, _now) -> None:
+        self._unsub_timer = None
+        if self.needs_refresh():
+            await self._async_try_refresh()
+
+    @callback
+    def async_start(self) -> None:
+        """Arm the refresh timer for the current token."""
+        if self._access_token.get("refresh_token") and not self._client_id:
+            _LOGGER.debug("No client_id configured, the access token is not refreshed")
+            return
+        self._schedule_refresh()
+
+    @callback
+    def async_stop(self) -> None:
+        """Cancel the refresh timer."""
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
@@ -0,0 +1,90 @@
+"""TTL cache of /api/token/getInfo results."""
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+
+from .const import DATA_INFO_CACHE, DEFAULT_INFO_TTL, DOMAIN
+from .singleflight import SingleFlight
+
+
+@dataclass
+class TokenInfo:
+    """Parsed getInfo answer of one token, certs indexed by serial number."""
+
+    data: dict[str, Any]
+    certs: dict[str, dict[str, Any]] = field(default_factory=dict)
+    fetched: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_response(cls, response: dict[str, Any]) -> TokenInfo:
+        """Build the index from a successful getInfo answer."""
+        data = response.get("data") or {}
+        certs = {
+            cert["SerialNumber"].upper(): cert
+            for cert in data.get("certs") or ()
+            if "SerialNumber" in cert
+        }
+        return cls(data, certs)
+
+    def has_cert(self, serial_number: str) -> bool:
+        """Return True if the token holds the cert `serial_number`."""
+        return serial_number.upper() in self.certs
+
+
+class TokenInfoCache:
+    """Keep getInfo results per token serial for `ttl` seconds.
+
+    Concurrent lookups of the same token share a single request to the API.
+    Failed lookups are never cached.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_INFO_TTL) -> None:
+        """Init cache."""
+        self._ttl = ttl
+        self._entries: dict[str, TokenInfo] = {}
+        self._pending: SingleFlight[TokenInfo | None] = SingleFlight()
+
+    def get(self, token_serial: str) -> TokenInfo | None:
+        """Return the cached info of a token if still fresh."""
+        info = self._entries.get(token_serial)
+        if info is not None and time.monotonic() - info.fetched > self._ttl:
+            del self._entries[token_serial]
+            info = None
+        return info
+
+    async def async_get(
+        self,
+        token_serial: str,
+        fetch: Callable[[], Awaitable[TokenInfo | None]],
+    ) -> TokenInfo | None:
+        """Return the cached info of a token, calling `fetch` on a miss."""
+        if (info := self.get(token_serial)) is not None:
+            return info
+
+        async def fetch_and_keep() -> TokenInfo | None:
+            info = await fetch()
+            if info is not None:
+                self._entries[token_serial] = info
+            return info
+
+        return await self._pending.async_call(fetch_and_keep, token_serial)
+
+    def invalidate(self, token_serial: str | None = None) -> None:
+        """Forget one token, or every token when `token_serial` is None."""
+        if token_serial is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(token_serial, None)
+
+
+def async_get_info_cache(hass: HomeAssistant) -> TokenInfoCache:
+    """Return the getInfo cache shared by every entry."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_INFO_CACHE not in data:
+        data[DATA_INFO_CACHE] = TokenInfoCache()
+    return data[DATA_INFO_CACHE]
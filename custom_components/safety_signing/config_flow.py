@@ -1,17 +1,24 @@
 """Config flow for Hello World integration."""
 from __future__ import annotations
+import asyncio
 import json
 import logging
+import re
 from typing import Any, Optional
 
 import voluptuous as vol
 from voluptuous import Schema, Required, Optional
 
 from homeassistant import config_entries, exceptions
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 
-from .const import DOMAIN, API_IP  # pylint:disable=unused-import
-from .token import Token
+from .const import DOMAIN, API_IP, CONF_API_SOCKET, CONF_APP_CONCURRENCY  # pylint:disable=unused-import
+from .api import ApiClient
+from .image_store import async_get_image_store
+from .ratelimit import RateLimiter
+from .schedule import Schedule
+from .session import SigningSession
+from .token import Token, clean_tax_ids, token_configs
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -32,6 +39,8 @@ DATA_SCHEMA = Schema({
     # Required("api_ip_address"): str
 })
 
+APPS = ["XHDO", "BHXH", "THUE", "HSKHAC", "HDLD", "HDKT"]
+
 
 async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
     """Validate the user input allows us to connect.
@@ -58,16 +67,16 @@ async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
 
     try:
         input_config = json.loads(data["json_config"])
-        input_config["token_serial"]
-        input_config["serial_number"]
-        input_config["pin"]
         input_config["access_token"]
-        input_config["app"]
-        input_config["pdf_options"]
-        input_config["tax_ids"]
-        pdf_options = ""
-        if "pdf_options" in input_config and len(input_config["pdf_options"]) >= 1:
-            pdf_options = json.dumps(input_config["pdf_options"])
+        # A config holds one token, or a `tokens` list sharing the access token
+        configs = token_configs(input_config)
+        for config in configs:
+            config["token_serial"]
+            config["serial_number"]
+            config["pin"]
+            config["app"]
+            config["pdf_options"]
+            config["tax_ids"]
     except:
         raise InvalidAccessToken
     
@@ -77,15 +86,6 @@ async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
     # Required("access_token"): str,
     # Required("app"): str
 
-    if len(input_config["token_serial"]) < 5 or len(input_config["serial_number"]) < 5:
-        raise InvalidSerialNumber
-    
-    if len(input_config["token_serial"]) < 5:
-        raise InvalidTokenSerial
-
-    if len(input_config["pin"]) < 6 or len(input_config["pin"]) > 9:
-        raise InvalidPin
-
     try:
         access_token = input_config["access_token"]
         if access_token["access_token"] and access_token["expires_in"] and access_token["refresh_token"] and access_token["scope"] and access_token["token_type"]:
@@ -93,26 +93,59 @@ async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
     except:
         raise InvalidAccessToken
 
-    if len(input_config["app"]) >= 1:
-        app_list = input_config["app"].split(';')
-        for app in app_list:
-            if app not in ["XHDO", "BHXH", "THUE", "HSKHAC", "HDLD", "HDKT"]:
-                raise InvalidApp
-
-    tax_ids = []
-    if len(input_config["tax_ids"]) >= 1:
-        for tax_id in input_config["tax_ids"]:
-            if tax_id.replace("-", "").isnumeric() and len(tax_id.replace("-", "")) >= 10 and len(tax_id.replace("-", "")) <= 16:
-                tax_ids.append(tax_id.replace("-", ""))
-    
-    if not tax_ids or len(tax_ids) == 0:
-        raise InvalidTaxList
+    # A client of its own, closed once checked: the shared client, rate limiter and
+    # publisher are only created by async_setup_entry, with the tuning of the entry.
+    # It opens no connection before its first request
+    client = ApiClient(data["api_ip_address"], socket_path=input_config.get(CONF_API_SOCKET))
+    rate_limiter = RateLimiter(rate=0)
+    # Sessions of the check only, the shared ones are opened by the entry
+    sessions: dict[tuple[str, str], SigningSession] = {}
+    tokens = []
+    for config in configs:
+        if len(config["token_serial"]) < 5 or len(config["serial_number"]) < 5:
+            raise InvalidSerialNumber
+
+        if len(config["token_serial"]) < 5:
+            raise InvalidTokenSerial
+
+        if len(config["pin"]) < 6 or len(config["pin"]) > 9:
+            raise InvalidPin
+
+        if len(config["app"]) >= 1:
+            app_list = config["app"].split(';')
+            for app in app_list:
+                if app not in APPS:
+                    raise InvalidApp
+
+        if config.get("schedule"):
+            try:
+                Schedule.from_config(config["schedule"], config["serial_number"])
+            except (AttributeError, TypeError, ValueError):
+                raise InvalidConfig
 
+        if not isinstance(config.get(CONF_APP_CONCURRENCY, 1), int) or config.get(CONF_APP_CONCURRENCY, 1) < 1:
+            raise InvalidConfig
 
-    token = Token(hass, data["name"], data["api_ip_address"], pdf_options, json.dumps(tax_ids), input_config["token_serial"], input_config["serial_number"], json.dumps(input_config["access_token"]), input_config["pin"], input_config["app"])
-    
-    is_valid = await token.check_serial_exists()
-    if is_valid:
+        tax_ids = clean_tax_ids(config["tax_ids"])
+        if not tax_ids or len(tax_ids) == 0:
+            raise InvalidTaxList
+
+        pdf_options = {}
+        if config["pdf_options"] and len(config["pdf_options"]) >= 1:
+            pdf_options = config["pdf_options"]
+        session_key = (config["token_serial"].upper(), config["pin"])
+        if session_key not in sessions:
+            sessions[session_key] = SigningSession(client, *session_key, rate_limiter=rate_limiter)
+        tokens.append(Token(hass, data["name"], data["api_ip_address"], pdf_options, tax_ids, config["token_serial"], config["serial_number"], input_config["access_token"], config["pin"], config["app"], client, rate_limiter=rate_limiter, session=sessions[session_key]))
+
+    try:
+        # Tokens of a multi-token config are checked together, they share one client
+        results = await asyncio.gather(*(token.check_serial_exists() for token in tokens))
+        # The entry opens its own sessions once set up
+        await asyncio.gather(*(session.async_close() for session in sessions.values()))
+    finally:
+        await client.close()
+    if all(results):
         _LOGGER.info("Token validated")
     else:
         raise SerialNotAvailable
@@ -128,6 +161,38 @@ async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
     return {"title": data["name"]}
 
 
+async def validate_options(hass: HomeAssistant, user_input: dict) -> dict[str, Any]:
+    """Validate the options form and return the entry options.
+
+    An empty field is left out, the json config value then applies. A stamp
+    image in pdf_options goes to the image store, options only keep its hash.
+    """
+    options: dict[str, Any] = {}
+    if app := user_input.get("app", "").strip():
+        if any(item not in APPS for item in app.split(';')):
+            raise InvalidApp
+        options["app"] = app
+
+    if tax_ids := user_input.get("tax_ids", "").strip():
+        cleaned = clean_tax_ids([item for item in re.split(r"[\s,;]+", tax_ids) if item])
+        if not cleaned:
+            raise InvalidTaxList
+        options["tax_ids"] = cleaned
+
+    if pdf_options := user_input.get("pdf_options", "").strip():
+        try:
+            pdf_options = json.loads(pdf_options)
+        except ValueError:
+            raise InvalidConfig
+        if not isinstance(pdf_options, dict):
+            raise InvalidConfig
+        image = pdf_options.get("image")
+        if isinstance(image, dict) and image.get("content"):
+            await async_get_image_store(hass).async_move(image)
+        options["pdf_options"] = pdf_options
+    return options
+
+
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Hello World."""
 
@@ -138,6 +203,12 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     # changes.
     CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_PUSH
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Return the options flow, applied without reloading the entry."""
+        return OptionsFlowHandler(config_entry)
+
     async def async_step_user(self, user_input=None):
         """Handle the initial step."""
         # This goes through the steps to take the user through the setup process.
@@ -187,6 +258,42 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             step_id="user", data_schema=DATA_SCHEMA, errors=errors
         )
 
+
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Change pdf_options, tax_ids and app of every token of an entry.
+
+    The new options are applied to the live tokens by the update listener, see
+    __init__.async_update_options. The token is not checked against the API again.
+    """
+
+    def __init__(self, config_entry):
+        """Init options flow."""
+        self._entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        """Handle the options form."""
+        errors = {}
+        if user_input is not None:
+            try:
+                options = await validate_options(self.hass, user_input)
+            except InvalidApp:
+                errors["app"] = "invalid_app"
+            except InvalidTaxList:
+                errors["tax_ids"] = "invalid_tax_ids"
+            except InvalidConfig:
+                errors["pdf_options"] = "invalid_config"
+            else:
+                return self.async_create_entry(title="", data=options)
+
+        options = self._entry.options
+        data_schema = Schema({
+            Optional("app", description={"suggested_value": options.get("app", "")}): str,
+            Optional("tax_ids", description={"suggested_value": ", ".join(options.get("tax_ids", []))}): str,
+            Optional("pdf_options", description={"suggested_value": json.dumps(options["pdf_options"]) if "pdf_options" in options else ""}): str,
+        })
+        return self.async_show_form(step_id="init", data_schema=data_schema, errors=errors)
+
+
 class SerialNotAvailable(exceptions.HomeAssistantError):
     """Failed to find serial & token in api"""
 
@@ -6,3 +6,153 @@ DOMAIN = "safety_signing"
 API_KEY = "123456789000"
 ICON_LIGHT = "mdi:camera-timer"
 API_IP = "127.0.0.1"
+API_PORT = 3000
+
+# Keys of the objects shared by every config entry in hass.data[DOMAIN]
+DATA_CLIENTS = "clients"
+
+# Optional keys of the json config tuning the shared HTTP client
+CONF_CONNECT_TIMEOUT = "connect_timeout"
+CONF_READ_TIMEOUT = "read_timeout"
+CONF_MAX_REQUESTS = "max_requests"
+
+DEFAULT_CONNECT_TIMEOUT = 5
+# autoSign walks every document of a run before answering, keep this generous
+DEFAULT_READ_TIMEOUT = 300
+DEFAULT_MAX_REQUESTS = 8
+DEFAULT_KEEPALIVE = 60
+# Unix socket of a signing API on the same host, TCP on API_IP stays the fallback
+CONF_API_SOCKET = "api_socket"
+# Requests of a host whose phase timings are kept for the diagnostics
+TRACE_BUFFER_SIZE = 200
+
+# Token bucket shared by the getInfo and autoSign calls of every entry on a host,
+# in requests per second, 0 disables it
+DATA_RATE_LIMITERS = "rate_limiters"
+CONF_RATE_LIMIT = "rate_limit"
+CONF_RATE_BURST = "rate_burst"
+DEFAULT_RATE_LIMIT = 5
+DEFAULT_RATE_BURST = 10
+
+DATA_SCHEDULER = "scheduler"
+
+# Jobs a single token may have waiting behind the running one
+DEFAULT_MAX_QUEUE = 4
+
+# Per-app dispatch, a run of a token with `split_apps` sends one autoSign per app.
+# `app_concurrency` caps the sub-requests of one run, `app_limits` maps an app to
+# the sub-requests it may have in flight across every token
+CONF_SPLIT_APPS = "split_apps"
+CONF_APP_CONCURRENCY = "app_concurrency"
+CONF_APP_LIMITS = "app_limits"
+DEFAULT_APP_CONCURRENCY = 3
+DEFAULT_APP_LIMIT = 4
+
+DATA_INFO_CACHE = "info_cache"
+
+# Seconds a getInfo answer is trusted before the token is enumerated again
+DEFAULT_INFO_TTL = 300
+
+DATA_VALIDATION_STORE = "validation_store"
+
+DATA_IMAGE_STORE = "image_store"
+
+# Key replacing pdf_options.image.content once the image is in the image store
+IMAGE_HASH = "content_hash"
+# Seconds an image no entry uses is kept, it may be on its way into one
+IMAGE_UNUSED_GRACE = 3600
+# `error` of an autoSign answer when the API does not hold the image of a hash yet
+ERROR_IMAGE_NOT_FOUND = "image_not_found"
+
+# Signing sessions, the token PIN is only sent to open one. Handles are renewed
+# this many seconds before the TTL the API grants, capped at DEFAULT_SESSION_TTL
+SESSION_OPEN_PATH = "/api/session/open"
+SESSION_CLOSE_PATH = "/api/session/close"
+DEFAULT_SESSION_TTL = 600
+SESSION_REFRESH_MARGIN = 30
+# `error` of an answer to a request carrying an expired or unknown session
+ERROR_SESSION_EXPIRED = "session_expired"
+# Sessions shared by the tokens of every entry, per API host, token serial and PIN
+DATA_SESSIONS = "sessions"
+# `error` of an answer when the token serial is not plugged into the signing host
+ERROR_TOKEN_NOT_FOUND = "token_not_found"
+
+# Runs that failed to reach the API, replayed in order once it is back
+DATA_OFFLINE_QUEUE = "offline_queue"
+DEFAULT_OFFLINE_QUEUE_SIZE = 10
+# Seconds between two replayed runs of a token
+REPLAY_INTERVAL = 5
+
+# OAuth refresh of the google access token sent with autoSign, the endpoint can be
+# pointed at a local stand-in through the json config
+CONF_TOKEN_URL = "token_url"
+CONF_CLIENT_ID = "client_id"
+CONF_CLIENT_SECRET = "client_secret"
+DEFAULT_TOKEN_URL = "https://oauth2.googleapis.com/token"
+# Refresh this many seconds before the access token expires
+TOKEN_REFRESH_MARGIN = 300
+# Seconds before retrying a failed refresh, doubled on every failure up to the max
+TOKEN_REFRESH_RETRY = 60
+TOKEN_REFRESH_MAX_RETRY = 3600
+
+# Availability of the signing API, probed in the background and on every request
+HEARTBEAT_PATH = "/api/health"
+HEARTBEAT_TIMEOUT = 5
+HEARTBEAT_MIN_INTERVAL = 5
+HEARTBEAT_MAX_INTERVAL = 120
+BREAKER_FAILURE_THRESHOLD = 3
+# Seconds an open breaker refuses requests before letting a trial one through
+BREAKER_RESET_TIMEOUT = 30
+
+# Retries of autoSign on transport failures, tunable through the json config
+CONF_RETRY_ATTEMPTS = "retry_attempts"
+CONF_RETRY_BASE_DELAY = "retry_base_delay"
+CONF_RETRY_MAX_DELAY = "retry_max_delay"
+DEFAULT_RETRY_ATTEMPTS = 4
+DEFAULT_RETRY_BASE_DELAY = 1
+DEFAULT_RETRY_MAX_DELAY = 30
+# Lets the API recognise a retried run it has already signed
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# Seconds metric sensors wait to batch changes before writing their state
+METRICS_UPDATE_INTERVAL = 10
+
+# Seconds the states of the crons are batched over before being written, tunable
+# through the json config, 0 writes them on the next loop iteration
+DATA_PUBLISHER = "publisher"
+CONF_STATE_WRITE_INTERVAL = "state_write_interval"
+DEFAULT_STATE_WRITE_INTERVAL = 1
+
+DATA_TIMER_WHEEL = "timer_wheel"
+
+# Seconds over which runs of crons sharing a schedule are spread
+DEFAULT_SCHEDULE_JITTER = 300
+
+# Websocket the API pushes job progress on, autoSign then answers right away
+PROGRESS_PATH = "/api/progress"
+# Seconds without any progress event after which a pushed run is considered lost
+PROGRESS_IDLE_TIMEOUT = 300
+
+DATA_HISTORY = "history"
+
+# Bounds of the run history, per token and in seconds
+HISTORY_MAX_RUNS = 5000
+HISTORY_MAX_AGE = 90 * 24 * 3600
+# Document records kept per run, runs of huge batches keep their counts only
+HISTORY_MAX_DOCUMENTS = 500
+# Seconds runs are buffered before being written together
+HISTORY_FLUSH_DELAY = 5
+# Runs returned by one get_history call
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+SERVICE_GET_HISTORY = "get_history"
+
+SERVICE_PROFILE = "profile"
+# Seconds a profile runs when no duration is given, and at most
+DEFAULT_PROFILE_DURATION = 60
+MAX_PROFILE_DURATION = 3600
+# Seconds between two stack samples in sampling mode
+PROFILE_SAMPLE_INTERVAL = 0.005
+# Seconds between two checks of the completed runs
+PROFILE_POLL_INTERVAL = 0.5
@@ -0,0 +1,90 @@
+"""Diagnostics support for Safety Signing."""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .token import Token
+
+# The PIN, the google tokens, session handles and the stamp image content
+TO_REDACT = {
+    "pin",
+    "access_token",
+    "refresh_token",
+    "client_secret",
+    "session",
+    "content",
+}
+
+
+def _token_diagnostics(token: Token) -> dict[str, Any]:
+    metrics = token.metrics
+    return {
+        "token_serial": token._token_serial,
+        "online": token.online,
+        "session_open": token._session._handle is not None,
+        "offline_queue": (
+            token._offline_queue.jobs(token._token_serial, [cron.cron_id for cron in token.crons])
+            if token._offline_queue else []
+        ),
+        "metrics": {
+            "auto_sign": metrics.auto_sign.as_dict(),
+            "get_info": metrics.get_info.as_dict(),
+            "rate_limit_wait": metrics.queue_wait.as_dict(),
+            "successes": metrics.successes,
+            "failures": dict(metrics.failures),
+            "documents": dict(metrics.documents),
+            "last_run": metrics.last_run,
+            "last_run_duration": metrics.last_run_duration,
+        },
+        "crons": [
+            {
+                "cron_id": cron.cron_id,
+                "enabled": cron.is_enable,
+                "running": cron.is_running,
+                "queued_jobs": cron.queued_jobs,
+                "progress": cron.progress,
+                "schedule": repr(cron.schedule) if cron.schedule else None,
+            }
+            for cron in token.crons
+        ],
+    }
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    try:
+        json_config = json.loads(entry.data["json_config"])
+    except (KeyError, ValueError):
+        json_config = None
+    diagnostics: dict[str, Any] = {
+        "entry": async_redact_data(
+            {"data": {**entry.data, "json_config": json_config}, "options": dict(entry.options)},
+            TO_REDACT,
+        ),
+    }
+
+    if (group := hass.data.get(DOMAIN, {}).get(entry.entry_id)) is None:
+        return diagnostics
+    client = group.tokens[0]._client if group.tokens else None
+    if client is not None:
+        diagnostics["client"] = {
+            "host": client.host,
+            "port": client.port,
+            "transport": client.transport,
+            "available": client.available,
+            "breaker": client._breaker.state,
+            "max_requests": client.max_requests,
+            "progress_stream": client.progress.connected,
+            # Oldest first, at most TRACE_BUFFER_SIZE
+            "traces": [trace.as_dict() for trace in client.traces],
+        }
+    diagnostics["tokens"] = [_token_diagnostics(token) for token in group.tokens]
+    return diagnostics
@@ -0,0 +1,128 @@
+"""Availability tracking of a signing API host."""
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable
+import asyncio
+import logging
+import time
+
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    DOMAIN,
+    HEARTBEAT_MAX_INTERVAL,
+    HEARTBEAT_MIN_INTERVAL,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stop sending requests to a host after consecutive transport failures.
+
+    Once open, requests are refused until `reset_timeout` has passed, then a single
+    trial request is let through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[], None],
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+    ) -> None:
+        """Init breaker, `on_change` is called when it opens or closes."""
+        self._on_change = on_change
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened = 0.0
+        self._trial = False
+        self.state = STATE_CLOSED
+
+    def allow(self) -> bool:
+        """Return True if a request may be sent now."""
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN and time.monotonic() - self._opened >= self._reset_timeout:
+            self.state = STATE_HALF_OPEN
+            self._trial = False
+        if self.state == STATE_HALF_OPEN and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """Record a request that reached the API."""
+        self._failures = 0
+        if self.state != STATE_CLOSED:
+            _LOGGER.info("Signing API reachable again")
+            self.state = STATE_CLOSED
+            self._on_change()
+
+    def record_failure(self) -> None:
+        """Record a request that could not reach the API."""
+        self._failures += 1
+        if self.state == STATE_HALF_OPEN or (
+            self.state == STATE_CLOSED and self._failures >= self._failure_threshold
+        ):
+            if self.state == STATE_CLOSED:
+                _LOGGER.warning("Signing API unreachable, failing fast")
+            self.state = STATE_OPEN
+            self._opened = time.monotonic()
+            self._on_change()
+
+
+class Heartbeat:
+    """Probe a host in the background and feed the result to its breaker.
+
+    The interval doubles while the host stays up, up to `HEARTBEAT_MAX_INTERVAL`,
+    and drops back to `HEARTBEAT_MIN_INTERVAL` while it is down. A probe is skipped
+    when a real request reached the host within the current interval.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        probe: Callable[[], Awaitable[bool]],
+        breaker: CircuitBreaker,
+        last_success: Callable[[], float],
+    ) -> None:
+        """Init heartbeat."""
+        self._hass = hass
+        self._probe = probe
+        self._breaker = breaker
+        self._last_success = last_success
+        self._interval = HEARTBEAT_MIN_INTERVAL
+        self._task: asyncio.Task | None = None
+
+    def async_start(self, name: str) -> None:
+        """Start probing."""
+        if self._task is None:
+            self._task = self._hass.async_create_background_task(
+                self._async_run(), f"{DOMAIN} heartbeat {name}"
+            )
+
+    async def async_stop(self) -> None:
+        """Stop probing."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _async_run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            if time.monotonic() - self._last_success() < self._interval:
+                continue
+            if await self._probe():
+                self._breaker.record_success()
+                self._interval = min(self._interval * 2, HEARTBEAT_MAX_INTERVAL)
+            else:
+                self._breaker.record_failure()
+                self._interval = HEARTBEAT_MIN_INTERVAL
@@ -0,0 +1,281 @@
+"""Append-only history of the autoSign runs, kept in SQLite next to HA storage."""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+import json
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .const import (
+    DATA_HISTORY,
+    DOMAIN,
+    HISTORY_FLUSH_DELAY,
+    HISTORY_MAX_AGE,
+    HISTORY_MAX_DOCUMENTS,
+    HISTORY_MAX_RUNS,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    token_serial TEXT NOT NULL,
+    cron_id TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL NOT NULL,
+    success INTEGER NOT NULL,
+    error TEXT,
+    message TEXT,
+    signed INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    apps TEXT NOT NULL,
+    documents TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_token ON runs (token_serial, id);
+CREATE INDEX IF NOT EXISTS runs_finished ON runs (finished);
+"""
+
+COLUMNS = (
+    "token_serial", "cron_id", "run_id", "started", "finished", "success", "error",
+    "message", "signed", "failed", "apps", "documents",
+)
+
+
+class DocumentLog:
+    """Document records of a run as they arrive, only the first ones are kept."""
+
+    def __init__(self) -> None:
+        """Init log."""
+        self.records: list[Any] = []
+        self.counts: Counter[str] = Counter()
+
+    def add(self, record: Any) -> str:
+        """Count a record, keep it if there is room and return its status."""
+        status = record.get("status", "signed") if isinstance(record, dict) else "signed"
+        self.counts[status] += 1
+        if len(self.records) < HISTORY_MAX_DOCUMENTS:
+            self.records.append(record)
+        return status
+
+    def merge(self, other: DocumentLog) -> None:
+        """Add the counts and the records kept by `other`."""
+        self.counts.update(other.counts)
+        self.records.extend(other.records[:HISTORY_MAX_DOCUMENTS - len(self.records)])
+
+
+@dataclass
+class RunRecord:
+    """Outcome of one autoSign run."""
+
+    token_serial: str
+    cron_id: str
+    run_id: str
+    started: float
+    finished: float
+    success: bool
+    error: str | None
+    message: str | None
+    signed: int = 0
+    failed: int = 0
+    apps: dict[str, int] = field(default_factory=dict)
+    documents: list[Any] = field(default_factory=list)
+
+    @classmethod
+    def from_response(
+        cls, cron_id: str, token_serial: str, run_id: str, started: float,
+        response: dict | None, error: str | None, documents: DocumentLog | None = None,
+    ) -> RunRecord:
+        """Summarize an autoSign answer, merged answers of a split run included.
+
+        Only the counts, the status of each app and the first document records
+        are kept, the rest of the answer is dropped. Records streamed into
+        `documents` stand in for the ones missing from the answer.
+        """
+        response = response or {}
+        data = response.get("data") or {}
+        answers = data.get("apps") or {"": response}
+        record = cls(
+            token_serial, cron_id, run_id, started, time.time(),
+            response.get("status") == 0, error, response.get("message"),
+        )
+        for app, answer in answers.items():
+            answer = answer or {}
+            app_data = answer.get("data") or {}
+            if app:
+                record.apps[app] = answer.get("status", 1)
+            record.signed += int(app_data.get("signed") or 0)
+            record.failed += int(app_data.get("failed") or 0)
+            room = HISTORY_MAX_DOCUMENTS - len(record.documents)
+            if room > 0:
+                record.documents += list(app_data.get("documents") or [])[:room]
+        if documents is not None:
+            record.signed = record.signed or documents.counts["signed"]
+            record.failed = record.failed or documents.counts["failed"]
+            record.documents = record.documents or documents.records
+        return record
+
+
+class JobHistory:
+    """Runs of every token in one SQLite database.
+
+    Records are buffered and written in batches from the executor. The database
+    keeps at most `max_runs` runs per token and none older than `max_age`.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        max_runs: int = HISTORY_MAX_RUNS,
+        max_age: float = HISTORY_MAX_AGE,
+    ) -> None:
+        """Init history, the database is opened on first use."""
+        self._hass = hass
+        self._path = Path(hass.config.path(STORAGE_DIR, DOMAIN, "history.db"))
+        self._max_runs = max_runs
+        self._max_age = max_age
+        self._conn: sqlite3.Connection | None = None
+        # Executor jobs may run on different threads, one at a time uses the connection
+        self._lock = threading.Lock()
+        self._pending: list[RunRecord] = []
+        self._unsub_flush: CALLBACK_TYPE | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self._path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _write(self, records: list[RunRecord]) -> None:
+        rows = [
+            tuple(
+                json.dumps(value, separators=(",", ":")) if name in ("apps", "documents") else value
+                for name, value in asdict(record).items()
+            )
+            for record in records
+        ]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO runs ({','.join(COLUMNS)}) VALUES ({','.join('?' * len(COLUMNS))})",
+                    rows,
+                )
+                conn.execute("DELETE FROM runs WHERE finished < ?", (time.time() - self._max_age,))
+                for token_serial in {record.token_serial for record in records}:
+                    conn.execute(
+                        "DELETE FROM runs WHERE token_serial = ? AND id <= ("
+                        "SELECT id FROM runs WHERE token_serial = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (token_serial, token_serial, self._max_runs),
+                    )
+
+    def _query(
+        self,
+        token_serial: str | None,
+        since: float | None,
+        until: float | None,
+        before_id: int | None,
+        limit: int,
+        documents: bool,
+    ) -> list[dict[str, Any]]:
+        clauses, params = [], []
+        for clause, value in (
+            ("token_serial = ?", token_serial),
+            ("finished >= ?", since),
+            ("finished < ?", until),
+            ("id < ?", before_id),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT * FROM runs {where} ORDER BY id DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        runs = []
+        for row in rows:
+            run = dict(row)
+            run["success"] = bool(run["success"])
+            run["apps"] = json.loads(run["apps"])
+            if documents:
+                run["documents"] = json.loads(run["documents"])
+            else:
+                del run["documents"]
+            runs.append(run)
+        return runs
+
+    def _close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @callback
+    def async_append(self, record: RunRecord) -> None:
+        """Buffer a run, written with the others of the next few seconds."""
+        self._pending.append(record)
+        if self._unsub_flush is None:
+            self._unsub_flush = async_call_later(
+                self._hass, HISTORY_FLUSH_DELAY, self._async_scheduled_flush
+            )
+
+    async def _async_scheduled_flush(self, _now) -> None:
+        self._unsub_flush = None
+        await self.async_flush()
+
+    async def async_flush(self) -> None:
+        """Write the buffered runs."""
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+        if self._pending:
+            records, self._pending = self._pending, []
+            await self._hass.async_add_executor_job(self._write, records)
+
+    async def async_query(
+        self,
+        token_serial: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        before_id: int | None = None,
+        limit: int = 50,
+        documents: bool = False,
+    ) -> list[dict[str, Any]]:
+        """Return a page of runs, newest first.
+
+        Pages are chained by passing the id of the last run as `before_id`, only
+        the rows of the page are read.
+        """
+        await self.async_flush()
+        return await self._hass.async_add_executor_job(
+            self._query, token_serial, since, until, before_id, limit, documents
+        )
+
+    async def async_close(self) -> None:
+        """Write the buffered runs and close the database."""
+        await self.async_flush()
+        await self._hass.async_add_executor_job(self._close)
+
+
+def async_get_history(hass: HomeAssistant) -> JobHistory:
+    """Return the history shared by every entry."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_HISTORY not in data:
+        history = data[DATA_HISTORY] = JobHistory(hass)
+
+        async def _async_close(_event) -> None:
+            await history.async_close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_close)
+    return data[DATA_HISTORY]
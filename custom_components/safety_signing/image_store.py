@@ -0,0 +1,110 @@
+"""Content-addressed store of the signature stamp images."""
+from __future__ import annotations
+
+from collections.abc import Collection
+import hashlib
+import logging
+from pathlib import Path
+import time
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .const import DATA_IMAGE_STORE, DOMAIN, IMAGE_HASH, IMAGE_UNUSED_GRACE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ImageStore:
+    """Keep each stamp image once on disk, named after the sha256 of its content.
+
+    The content is the base64 string found in `pdf_options.image.content`, it is
+    stored and handed back unchanged.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Init store."""
+        self._hass = hass
+        self._path = Path(hass.config.path(STORAGE_DIR, DOMAIN, "images"))
+
+    @staticmethod
+    def digest(content: str) -> str:
+        """Return the hash an image is stored under."""
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _write(self, digest: str, content: str) -> None:
+        path = self._path / digest
+        if path.exists():
+            # Used again, kept from async_remove_unused like a new image
+            path.touch()
+            return
+        self._path.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(content)
+        tmp.replace(path)
+
+    def _read(self, digest: str) -> str | None:
+        try:
+            return (self._path / digest).read_text()
+        except FileNotFoundError:
+            return None
+
+    async def async_put(self, content: str) -> str:
+        """Store an image and return its hash."""
+        digest = self.digest(content)
+        await self._hass.async_add_executor_job(self._write, digest, content)
+        return digest
+
+    async def async_get(self, digest: str) -> str | None:
+        """Return the content of an image, None if it is not stored."""
+        return await self._hass.async_add_executor_job(self._read, digest)
+
+    async def async_move(self, image: dict) -> bool:
+        """Replace the inline content of `image` with its hash, True if it did.
+
+        The content is only dropped once the stored copy reads back the same, an
+        image that could not be stored stays inline and is sent as is.
+        """
+        content = image["content"]
+        try:
+            digest = await self.async_put(content)
+            stored = await self.async_get(digest)
+        except OSError as err:
+            _LOGGER.warning("Could not store stamp image, it stays in the entry: %s", err)
+            return False
+        if stored != content:
+            _LOGGER.warning("Stamp image %s did not read back, it stays in the entry", digest)
+            return False
+        image[IMAGE_HASH] = digest
+        del image["content"]
+        return True
+
+    def _remove_unused(self, used: Collection[str]) -> list[str]:
+        if not self._path.is_dir():
+            return []
+        # Images stored moments ago may not be in an entry yet
+        cutoff = time.time() - IMAGE_UNUSED_GRACE
+        removed = []
+        for path in self._path.iterdir():
+            if path.name not in used and path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                removed.append(path.name)
+        return removed
+
+    async def async_remove_unused(self, used: Collection[str]) -> None:
+        """Delete the images whose hash is not in `used`, replaced or orphaned ones."""
+        try:
+            removed = await self._hass.async_add_executor_job(self._remove_unused, used)
+        except OSError as err:
+            _LOGGER.warning("Could not clean up the stamp images: %s", err)
+            return
+        if removed:
+            _LOGGER.debug("Removed unused stamp images %s", removed)
+
+
+def async_get_image_store(hass: HomeAssistant) -> ImageStore:
+    """Return the image store shared by every entry."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_IMAGE_STORE not in data:
+        data[DATA_IMAGE_STORE] = ImageStore(hass)
+    return data[DATA_IMAGE_STORE]
@@ -17,7 +17,7 @@ from homeassistant.components.cover import (
 from homeassistant.components.button import ButtonEntity
 from homeassistant.components.light import LightEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from .const import DOMAIN, ICON_LIGHT
 
@@ -28,13 +28,19 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     """Add cover for passed config_entry in HA."""
     # The token is loaded from the associated hass.data entry that was created in the
     # __init__.async_setup_entry function
-    token = hass.data[DOMAIN][config_entry.entry_id]
+    group = hass.data[DOMAIN][config_entry.entry_id]
 
-    new_devices = []
-    for cron in token.crons:
-        new_devices.append(CronJobRunner(hass, cron))
-    if new_devices:
-        async_add_entities(new_devices)
+    # Entities of a token are only added once the token is active, which may be
+    # long after setup for a token that was not valid at startup
+    @callback
+    def async_add_token(token):
+        new_devices = []
+        for cron in token.crons:
+            new_devices.append(CronJobRunner(hass, cron))
+        if new_devices:
+            async_add_entities(new_devices)
+
+    config_entry.async_on_unload(group.async_add_listener(async_add_token))
 
 
 # This entire class could be written to extend a base class to ensure common attributes
@@ -50,7 +56,6 @@ class CronJobRunner(LightEntity):
         self._cron = cron
         self._attr_unique_id = f"{self._cron.cron_id}_action"
         self._attr_name = f"{self._cron.name} action"
-        self.is_light_on = False
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -72,21 +77,24 @@ class CronJobRunner(LightEntity):
     async def async_added_to_hass(self) -> None:
         """Run when this Entity has been added to HA."""
         self._cron.register_callback(self.async_write_ha_state)
+        # Written with the next batch, the breaker flips every entity at once
+        self.async_on_remove(
+            self._cron.token._client.async_add_listener(self._cron.async_publish_updates)
+        )
 
     async def async_will_remove_from_hass(self) -> None:
         """Entity being removed from hass."""
         self._cron.remove_callback(self.async_write_ha_state)
     
     @property
-    def state(self):
-        if self.is_light_on:
-            return "on"
-        else:
-            return "off"
+    def is_on(self) -> bool:
+        """Return True while a run of the cron is queued or in progress."""
+        return self._cron.is_running
 
     @property
-    def is_on(self) -> bool:
-        return self.is_light_on
+    def extra_state_attributes(self):
+        """Return the document counts of the current or last run."""
+        return self._cron.progress
 
     @property
     def icon(self) -> str:
@@ -94,12 +102,9 @@ class CronJobRunner(LightEntity):
         return ICON_LIGHT
 
     async def async_turn_on(self, **kwargs):
-        """Turn device on."""
-        self.is_light_on = True
+        """Turn device on, the run itself happens in the background."""
         if self._cron.is_enable == "on":
-            await self._cron.running_cron()
-            self.is_light_on = False
+            self._cron.schedule_run()
 
     async def async_turn_off(self, **kwargs):
-        self.is_light_on = False
-        """Do nothing"""
+        """Do nothing, a queued run can not be cancelled."""
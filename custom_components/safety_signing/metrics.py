@@ -0,0 +1,158 @@
+"""Request metrics of a token, published through sensor entities."""
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import Counter
+import time
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+from .api import ApiBusyError, ApiLoginError, ApiResponseError, ApiUnavailableError
+from .const import METRICS_UPDATE_INTERVAL
+
+# Upper bounds in seconds, autoSign runs take from a second to several minutes
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float("inf"))
+
+
+class Histogram:
+    """Fixed bucket latency histogram."""
+
+    def __init__(self) -> None:
+        """Init histogram."""
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add a sample, in seconds."""
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percent: float) -> float | None:
+        """Return the upper bound of the bucket holding `percent` of the samples."""
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the summary exposed as state attributes."""
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": {
+                str(bound): count for bound, count in zip(BUCKETS, self.counts) if count
+            },
+        }
+
+
+def error_class(err: Exception | None) -> str:
+    """Return the failure counter an error is counted under."""
+    if err is None:
+        return "signing"
+    if isinstance(err, ApiLoginError):
+        return "login"
+    if isinstance(err, ApiResponseError):
+        return "response"
+    if isinstance(err, ApiUnavailableError):
+        return "unavailable"
+    if isinstance(err, ApiBusyError):
+        return "busy"
+    return "connection"
+
+
+class TokenMetrics:
+    """Counters and histograms of the getInfo and autoSign calls of a token.
+
+    Listeners are called at most once per `METRICS_UPDATE_INTERVAL` so a busy
+    token does not flood the recorder with state changes.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Init metrics."""
+        self._hass = hass
+        self.auto_sign = Histogram()
+        self.get_info = Histogram()
+        # Seconds requests waited for the rate limiter of the API host
+        self.queue_wait = Histogram()
+        self.successes = 0
+        self.failures: Counter[str] = Counter()
+        self.last_run_duration: float | None = None
+        self.last_run: float | None = None
+        # Documents of every run by status, counted once their attempt answered
+        self.documents: Counter[str] = Counter()
+        self._listeners: list[CALLBACK_TYPE] = []
+        self._unsub_flush: CALLBACK_TYPE | None = None
+
+    @property
+    def success_rate(self) -> float | None:
+        """Return the share of successful autoSign runs, in percent."""
+        total = self.successes + sum(self.failures.values())
+        return round(self.successes * 100 / total, 1) if total else None
+
+    def record_get_info(self, duration: float) -> None:
+        """Record a getInfo call."""
+        self.get_info.observe(duration)
+        self.async_mark_changed()
+
+    def record_queue_wait(self, duration: float) -> None:
+        """Record the time a request waited for the rate limiter."""
+        self.queue_wait.observe(duration)
+        self.async_mark_changed()
+
+    def record_auto_sign(
+        self, duration: float, success: bool, err: Exception | None = None
+    ) -> None:
+        """Record an autoSign run, `err` is the API error that ended it."""
+        self.auto_sign.observe(duration)
+        self.last_run_duration = duration
+        self.last_run = time.time()
+        if success:
+            self.successes += 1
+        else:
+            self.failures[error_class(err)] += 1
+        self.async_mark_changed()
+
+    def record_documents(self, counts: Counter[str]) -> None:
+        """Count the documents handled by an attempt, by status."""
+        self.documents.update(counts)
+        self.async_mark_changed()
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Call `update_callback` on batched changes, return a remover."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(update_callback)
+            if not self._listeners and self._unsub_flush is not None:
+                self._unsub_flush()
+                self._unsub_flush = None
+
+        return remove_listener
+
+    @callback
+    def async_mark_changed(self) -> None:
+        """Schedule a flush to the listeners if none is pending."""
+        if self._listeners and self._unsub_flush is None:
+            self._unsub_flush = async_call_later(
+                self._hass, METRICS_UPDATE_INTERVAL, self._async_flush
+            )
+
+    @callback
+    def _async_flush(self, _now) -> None:
+        self._unsub_flush = None
+        for update_callback in list(self._listeners):
+            update_callback()
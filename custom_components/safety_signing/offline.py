@@ -0,0 +1,103 @@
+"""Runs that could not reach the signing API, kept in HA storage until replayed."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Collection
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import DATA_OFFLINE_QUEUE, DEFAULT_OFFLINE_QUEUE_SIZE, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.offline_queue"
+# Short, a run queued just before a crash must not be lost
+SAVE_DELAY = 1
+
+
+class OfflineQueue:
+    """Runs waiting for the API, in order, per token serial.
+
+    A cron has at most one run in the queue: a later failure of the same cron is
+    merged into it, since one run signs everything pending. The run keeps its
+    idempotency key so the API can drop it if the original did go through.
+    """
+
+    def __init__(self, hass: HomeAssistant, max_jobs: int = DEFAULT_OFFLINE_QUEUE_SIZE) -> None:
+        """Init queue."""
+        self._store: Store[dict[str, list[dict[str, Any]]]] = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY
+        )
+        self._max_jobs = max_jobs
+        self._data: dict[str, list[dict[str, Any]]] = {}
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+
+    async def async_load(self) -> None:
+        """Load the stored runs once."""
+        async with self._load_lock:
+            if not self._loaded:
+                self._data = await self._store.async_load() or {}
+                self._loaded = True
+
+    def _save(self) -> None:
+        self._store.async_delay_save(lambda: self._data, SAVE_DELAY)
+
+    def jobs(
+        self, token_serial: str, cron_ids: Collection[str] | None = None
+    ) -> list[dict[str, Any]]:
+        """Return the runs waiting for token `token_serial`, oldest first.
+
+        Entries sharing a token serial share its queue, `cron_ids` keeps the runs
+        of the given crons only.
+        """
+        jobs = self._data.get(token_serial, [])
+        if cron_ids is None:
+            return jobs
+        return [job for job in jobs if job["cron_id"] in cron_ids]
+
+    def add(self, token_serial: str, cron_id: str, run_id: str) -> None:
+        """Queue a run of `cron_id`, merged into the one already waiting if any."""
+        jobs = self._data.setdefault(token_serial, [])
+        for job in jobs:
+            if job["cron_id"] == cron_id:
+                job["triggers"] += 1
+                self._save()
+                return
+        if len(jobs) >= self._max_jobs:
+            dropped = jobs.pop(0)
+            _LOGGER.warning(
+                "Offline queue of token %s is full, dropped run %s", token_serial, dropped["run_id"]
+            )
+        jobs.append({"cron_id": cron_id, "run_id": run_id, "queued": time.time(), "triggers": 1})
+        self._save()
+
+    def remove(self, token_serial: str, cron_id: str) -> None:
+        """Forget the waiting run of `cron_id`, a run of it has reached the API."""
+        jobs = self._data.get(token_serial)
+        if not jobs:
+            return
+        self._data[token_serial] = [job for job in jobs if job["cron_id"] != cron_id]
+        if not self._data[token_serial]:
+            del self._data[token_serial]
+        self._save()
+
+    def clear(self, token_serial: str, cron_ids: Collection[str]) -> None:
+        """Forget the waiting runs of crons of a token, used when their entry is removed."""
+        for cron_id in cron_ids:
+            self.remove(token_serial, cron_id)
+
+
+async def async_get_offline_queue(hass: HomeAssistant) -> OfflineQueue:
+    """Return the loaded queue shared by every entry."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_OFFLINE_QUEUE not in data:
+        data[DATA_OFFLINE_QUEUE] = OfflineQueue(hass)
+    queue: OfflineQueue = data[DATA_OFFLINE_QUEUE]
+    await queue.async_load()
+    return queue
@@ -0,0 +1,126 @@
+"""On-demand profiling of the event loop work of the integration."""
+from __future__ import annotations
+
+from collections import Counter
+import asyncio
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import DOMAIN, PROFILE_POLL_INTERVAL, PROFILE_SAMPLE_INTERVAL
+from .token import TokenGroup
+
+_LOGGER = logging.getLogger(__name__)
+
+MODE_DETERMINISTIC = "deterministic"
+MODE_SAMPLING = "sampling"
+
+# Frames of this package, sampled stacks without any are dropped
+_PACKAGE_DIR = os.path.dirname(__file__)
+
+_PROFILE_LOCK = asyncio.Lock()
+
+
+class StackSampler:
+    """Sample the stack of the event loop thread from a side thread.
+
+    Only stacks going through this integration are counted. They are written in
+    the folded format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL) -> None:
+        """Init sampler."""
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            if (frame := sys._current_frames().get(self._thread_id)) is None:
+                continue
+            self.samples += 1
+            names = []
+            ours = False
+            while frame is not None:
+                code = frame.f_code
+                ours = ours or code.co_filename.startswith(_PACKAGE_DIR)
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if ours:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread = threading.Thread(target=self._run, name=f"{DOMAIN} sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path: str) -> None:
+        """Write the folded stacks to `path`."""
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+def _completed_runs(hass: HomeAssistant) -> int:
+    groups = [value for value in hass.data.get(DOMAIN, {}).values() if isinstance(value, TokenGroup)]
+    return sum(token.metrics.auto_sign.count for group in groups for token in group.tokens)
+
+
+async def async_profile(
+    hass: HomeAssistant, mode: str, duration: float, runs: int | None = None
+) -> str:
+    """Profile the event loop for `duration` seconds or `runs` autoSign runs.
+
+    Whichever comes first ends the profile. The deterministic mode profiles
+    every call made on the loop thread with cProfile, the sampling mode only
+    costs a periodic stack snapshot. Return the path of the file written in
+    the config directory.
+    """
+    if _PROFILE_LOCK.locked():
+        raise HomeAssistantError("A profile is already running")
+    async with _PROFILE_LOCK:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if mode == MODE_SAMPLING:
+            path = hass.config.path(f"{DOMAIN}_profile_{stamp}.folded")
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        else:
+            path = hass.config.path(f"{DOMAIN}_profile_{stamp}.prof")
+            profiler = cProfile.Profile()
+            profiler.enable()
+        _LOGGER.warning("Profiling in %s mode, writing to %s", mode, path)
+
+        start_runs = _completed_runs(hass)
+        deadline = time.monotonic() + duration
+        try:
+            while time.monotonic() < deadline:
+                if runs is not None and _completed_runs(hass) - start_runs >= runs:
+                    break
+                await asyncio.sleep(min(PROFILE_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+        finally:
+            if isinstance(profiler, StackSampler):
+                await hass.async_add_executor_job(profiler.stop)
+            else:
+                profiler.disable()
+
+        if isinstance(profiler, StackSampler):
+            await hass.async_add_executor_job(profiler.write, path)
+        else:
+            await hass.async_add_executor_job(profiler.dump_stats, path)
+        _LOGGER.warning("Profile written to %s", path)
+        return path
@@ -0,0 +1,99 @@
+"""Job progress pushed by the signing API over a websocket."""
+from __future__ import annotations
+
+from collections.abc import Callable
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+
+from .const import PROGRESS_PATH
+
+if TYPE_CHECKING:
+    from .api import ApiClient
+
+_LOGGER = logging.getLogger(__name__)
+
+# Event sent to the subscribers when the stream drops, their jobs' fate is unknown
+EVENT_DISCONNECTED = "disconnected"
+
+
+class ProgressStream:
+    """Single websocket per API host, dispatching events to subscribers by job id.
+
+    Every event is a json object carrying the `job_id` it belongs to, which is the
+    idempotency key of the autoSign call, and an `event` among found, signed,
+    failed and done.
+    """
+
+    def __init__(self, client: ApiClient) -> None:
+        """Init stream, connected on first use."""
+        self._client = client
+        self._ws: aiohttp.ClientWebSocketResponse | None = None
+        self._reader: asyncio.Task | None = None
+        self._connect_lock = asyncio.Lock()
+        self._subscribers: dict[str, Callable[[dict[str, Any]], None]] = {}
+        # The API has no progress channel, stop trying
+        self._unsupported = False
+
+    @property
+    def connected(self) -> bool:
+        """Return True while the websocket is open."""
+        return self._ws is not None and not self._ws.closed
+
+    async def async_connect(self) -> bool:
+        """Open the websocket if needed, return False when it can not be used."""
+        if self._unsupported:
+            return False
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            try:
+                self._ws = await self._client.async_ws_connect(PROGRESS_PATH)
+            except aiohttp.WSServerHandshakeError as err:
+                if err.status == 404:
+                    _LOGGER.info("Signing API has no progress stream, using plain requests")
+                    self._unsupported = True
+                return False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                _LOGGER.debug("Could not open progress stream: %r", err)
+                return False
+            self._reader = asyncio.get_running_loop().create_task(self._async_read(self._ws))
+            return True
+
+    def subscribe(
+        self, job_id: str, on_event: Callable[[dict[str, Any]], None]
+    ) -> Callable[[], None]:
+        """Call `on_event` with every event of `job_id`, return an unsubscriber."""
+        self._subscribers[job_id] = on_event
+
+        def unsubscribe() -> None:
+            if self._subscribers.get(job_id) is on_event:
+                del self._subscribers[job_id]
+
+        return unsubscribe
+
+    async def _async_read(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    event = message.json()
+                except ValueError:
+                    continue
+                if (on_event := self._subscribers.get(event.get("job_id"))) is not None:
+                    on_event(event)
+        finally:
+            for job_id, on_event in list(self._subscribers.items()):
+                on_event({"job_id": job_id, "event": EVENT_DISCONNECTED})
+
+    async def close(self) -> None:
+        """Close the websocket."""
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
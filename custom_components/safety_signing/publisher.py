@@ -0,0 +1,60 @@
+"""Batched publication of entity states."""
+from __future__ import annotations
+
+from collections.abc import Callable
+import asyncio
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DATA_PUBLISHER, DEFAULT_STATE_WRITE_INTERVAL, DOMAIN
+
+
+class StatePublisher:
+    """Coalesce state writes of every cron into one flush per window.
+
+    A cron scheduled several times before the flush is written once, with the
+    state it has at flush time. A window of 0 flushes on the next loop iteration.
+    """
+
+    def __init__(self, hass: HomeAssistant, interval: float = DEFAULT_STATE_WRITE_INTERVAL) -> None:
+        """Init publisher."""
+        self._hass = hass
+        self.interval = interval
+        # Insertion ordered, a key scheduled again keeps its place
+        self._pending: dict[str, Callable[[], None]] = {}
+        self._handle: asyncio.Handle | None = None
+
+    @callback
+    def async_schedule(self, key: str, write: Callable[[], None]) -> None:
+        """Call `write` with the next flush, once whatever the number of calls."""
+        self._pending[key] = write
+        if self._handle is None:
+            if self.interval > 0:
+                self._handle = self._hass.loop.call_later(self.interval, self._async_flush)
+            else:
+                self._handle = self._hass.loop.call_soon(self._async_flush)
+
+    @callback
+    def _async_flush(self) -> None:
+        self._handle = None
+        pending, self._pending = self._pending, {}
+        for write in pending.values():
+            write()
+
+    @callback
+    def async_stop(self) -> None:
+        """Write what is pending right away and stop batching."""
+        if self._handle is not None:
+            self._handle.cancel()
+        self._async_flush()
+
+
+def async_get_publisher(hass: HomeAssistant, **options) -> StatePublisher:
+    """Return the publisher shared by every entry.
+
+    `options` are only used when the publisher does not exist yet.
+    """
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_PUBLISHER not in data:
+        data[DATA_PUBLISHER] = StatePublisher(hass, **options)
+    return data[DATA_PUBLISHER]
@@ -0,0 +1,56 @@
+"""Token bucket rate limiter shared by every entry talking to one API host."""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+
+from .const import DATA_RATE_LIMITERS, DEFAULT_RATE_BURST, DEFAULT_RATE_LIMIT, DOMAIN
+
+
+class RateLimiter:
+    """Let at most `rate` requests per second through, with bursts of `burst`.
+
+    Waiting callers are served in arrival order. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE_LIMIT, burst: int = DEFAULT_RATE_BURST) -> None:
+        """Init limiter with a full bucket."""
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def async_acquire(self) -> float:
+        """Wait for a slot and return the seconds spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+        start = time.monotonic()
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+        return time.monotonic() - start
+
+
+def async_get_rate_limiter(hass: HomeAssistant, host: str, **options: Any) -> RateLimiter:
+    """Return the limiter shared by every entry talking to `host`.
+
+    `options` are only used when the limiter does not exist yet.
+    """
+    limiters: dict[str, RateLimiter] = hass.data.setdefault(DOMAIN, {}).setdefault(
+        DATA_RATE_LIMITERS, {}
+    )
+    if host not in limiters:
+        limiters[host] = RateLimiter(**options)
+    return limiters[host]
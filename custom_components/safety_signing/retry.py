@@ -0,0 +1,60 @@
+"""Retry policy of the autoSign calls."""
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+import asyncio
+import logging
+import random
+from typing import Any, TypeVar
+
+from .api import ApiConnectionError, ApiNotFoundError, ApiUnavailableError
+from .const import DEFAULT_RETRY_ATTEMPTS, DEFAULT_RETRY_BASE_DELAY, DEFAULT_RETRY_MAX_DELAY
+
+_LOGGER = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+def is_retryable(err: Exception) -> bool:
+    """Return True for transport failures worth another attempt.
+
+    Of the answers of the API, only the busy ones are retried. Signing failures,
+    refused logins and error answers never are, the API did get the request. A
+    request refused by the open circuit breaker is not retried either, the API
+    is down, nor one for a path the API does not serve.
+    """
+    return isinstance(err, ApiConnectionError) and not isinstance(
+        err, (ApiUnavailableError, ApiNotFoundError)
+    )
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+
+    attempts: int = DEFAULT_RETRY_ATTEMPTS
+    base_delay: float = DEFAULT_RETRY_BASE_DELAY
+    max_delay: float = DEFAULT_RETRY_MAX_DELAY
+
+    def delay(self, attempt: int) -> float:
+        """Return the wait before retry number `attempt`, starting at 0."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def async_call(
+        self, func: Callable[..., Awaitable[_T]], *args: Any
+    ) -> _T:
+        """Await `func(*args)`, retrying retryable errors up to `attempts` times."""
+        attempt = 0
+        while True:
+            try:
+                return await func(*args)
+            except ApiConnectionError as err:
+                if attempt + 1 >= self.attempts or not is_retryable(err):
+                    raise
+                delay = self.delay(attempt)
+                _LOGGER.warning(
+                    "Attempt %s failed (%s), retrying in %.1fs", attempt + 1, err, delay
+                )
+                attempt += 1
+                await asyncio.sleep(delay)
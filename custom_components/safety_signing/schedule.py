@@ -0,0 +1,159 @@
+"""Built-in run schedules of the crons, driven by a single timer wheel."""
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import timedelta
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.util import dt as dt_util
+
+from .const import DATA_TIMER_WHEEL, DEFAULT_SCHEDULE_JITTER, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Schedule:
+    """When a cron runs on its own.
+
+    Runs happen every `interval` seconds and/or at the local `times` of each day,
+    shifted by `offset` seconds. The offset is derived from the cron id, so crons
+    sharing a schedule are spread over the jitter window the same way every day.
+    """
+
+    interval: float | None = None
+    times: list[tuple[int, int]] = field(default_factory=list)
+    offset: float = 0.0
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any], seed: str) -> Schedule:
+        """Build a schedule from its json config, raise ValueError if invalid.
+
+        The config looks like {"interval": 3600} or {"times": ["08:00", "17:30"]},
+        with an optional "jitter" window in seconds.
+        """
+        interval = config.get("interval")
+        if interval is not None and (not isinstance(interval, (int, float)) or interval < 60):
+            raise ValueError("Schedule interval must be at least 60 seconds")
+        times = []
+        for value in config.get("times", []):
+            hour, minute = (int(part) for part in value.split(":"))
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError(f"Invalid schedule time {value}")
+            times.append((hour, minute))
+        if interval is None and not times:
+            raise ValueError("Schedule needs an interval or times")
+
+        jitter = float(config.get("jitter", DEFAULT_SCHEDULE_JITTER))
+        if interval is not None:
+            jitter = min(jitter, interval)
+        digest = int(hashlib.sha256(seed.encode()).hexdigest(), 16)
+        offset = (digest % 1_000_000) / 1_000_000 * jitter
+        return cls(interval, sorted(times), offset)
+
+    def next_run(self, now: float) -> float:
+        """Return the timestamp of the first run after `now`."""
+        candidates = []
+        if self.interval is not None:
+            # Aligned on the epoch so that the offset alone spreads the crons
+            slot = (now - self.offset) // self.interval + 1
+            candidates.append(slot * self.interval + self.offset)
+        if self.times:
+            today = dt_util.as_local(dt_util.utc_from_timestamp(now)).replace(
+                second=0, microsecond=0
+            )
+            for days in (0, 1):
+                for hour, minute in self.times:
+                    run = (today + timedelta(days=days)).replace(hour=hour, minute=minute)
+                    if (timestamp := run.timestamp() + self.offset) > now:
+                        candidates.append(timestamp)
+        return min(candidates)
+
+
+class TimerWheel:
+    """Fire scheduled actions of every entry from a single loop timer.
+
+    Pending runs are kept in a heap, only the earliest one is armed on the loop.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Init wheel."""
+        self._hass = hass
+        self._heap: list[tuple[float, int, str]] = []
+        # Schedule, action and sequence number of the heap entry currently valid
+        self._actions: dict[str, tuple[Schedule, Callable[[], None], int]] = {}
+        self._counter = itertools.count()
+        self._handle: asyncio.TimerHandle | None = None
+
+    @callback
+    def async_schedule(
+        self, key: str, schedule: Schedule, action: Callable[[], None]
+    ) -> CALLBACK_TYPE:
+        """Call `action` at every run of `schedule`, return a remover."""
+        self._push(key, schedule, action, schedule.next_run(time.time()))
+        self._arm()
+
+        @callback
+        def remove() -> None:
+            # The heap entry is skipped when it comes due
+            if key in self._actions and self._actions[key][1] is action:
+                del self._actions[key]
+
+        return remove
+
+    def _push(
+        self, key: str, schedule: Schedule, action: Callable[[], None], due: float
+    ) -> None:
+        seq = next(self._counter)
+        self._actions[key] = (schedule, action, seq)
+        heapq.heappush(self._heap, (due, seq, key))
+
+    @callback
+    def _arm(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._heap:
+            delay = max(self._heap[0][0] - time.time(), 0)
+            self._handle = self._hass.loop.call_later(delay, self._async_fire)
+
+    @callback
+    def _async_fire(self) -> None:
+        self._handle = None
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _due, seq, key = heapq.heappop(self._heap)
+            if key not in self._actions or self._actions[key][2] != seq:
+                continue
+            schedule, action, _seq = self._actions[key]
+            self._push(key, schedule, action, schedule.next_run(now))
+            try:
+                action()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Scheduled run of %s failed", key)
+        self._arm()
+
+    @callback
+    def async_stop(self) -> None:
+        """Cancel the timer and forget every schedule."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._heap.clear()
+        self._actions.clear()
+
+
+def async_get_timer_wheel(hass: HomeAssistant) -> TimerWheel:
+    """Return the timer wheel shared by every entry."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_TIMER_WHEEL not in data:
+        data[DATA_TIMER_WHEEL] = TimerWheel(hass)
+    return data[DATA_TIMER_WHEEL]
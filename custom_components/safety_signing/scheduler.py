@@ -0,0 +1,158 @@
+"""Job scheduler serializing autoSign runs per physical token."""
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+import asyncio
+import itertools
+import logging
+import time
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import DATA_SCHEDULER, DEFAULT_APP_LIMIT, DEFAULT_MAX_QUEUE, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+_JOB_IDS = itertools.count(1)
+
+
+class QueueFullError(HomeAssistantError):
+    """Error to indicate the job queue of a token is full."""
+
+
+@dataclass
+class Job:
+    """A queued run of one cron."""
+
+    key: str
+    name: str
+    run: Callable[[], Awaitable[None]]
+    job_id: int = field(default_factory=lambda: next(_JOB_IDS))
+    created: float = field(default_factory=time.monotonic)
+    # Number of triggers merged into this job while it was waiting
+    triggers: int = 1
+    started: float | None = None
+    done: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class JobScheduler:
+    """Run at most one job at a time per token serial.
+
+    Each token has its own bounded queue. A trigger for a cron that already has
+    a job waiting in the queue is merged into that job instead of adding one.
+    Runs split per app also share a limit per app name across every token.
+    """
+
+    def __init__(self, hass: HomeAssistant, max_queue: int = DEFAULT_MAX_QUEUE) -> None:
+        """Init scheduler."""
+        self._hass = hass
+        self._max_queue = max_queue
+        self._queues: dict[str, deque[Job]] = {}
+        self._running: dict[str, Job] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self._app_limits: dict[str, int] = {}
+        self._app_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def set_app_limits(self, limits: dict[str, int]) -> None:
+        """Set the in-flight limit of apps whose semaphore does not exist yet."""
+        for app, limit in limits.items():
+            if app not in self._app_semaphores:
+                self._app_limits[app] = max(int(limit), 1)
+
+    def app_semaphore(self, app: str) -> asyncio.Semaphore:
+        """Return the semaphore bounding the sub-requests of `app`."""
+        if app not in self._app_semaphores:
+            self._app_semaphores[app] = asyncio.Semaphore(
+                self._app_limits.get(app, DEFAULT_APP_LIMIT)
+            )
+        return self._app_semaphores[app]
+
+    def enqueue(self, key: str, name: str, run: Callable[[], Awaitable[None]]) -> Job:
+        """Queue `run` for token `key` and return right away.
+
+        `name` identifies the cron, pending jobs with the same name are coalesced.
+        """
+        queue = self._queues.setdefault(key, deque())
+        for job in queue:
+            if job.name == name:
+                job.triggers += 1
+                _LOGGER.debug("Merged trigger into pending job %s of %s", job.job_id, name)
+                return job
+        if len(queue) >= self._max_queue:
+            raise QueueFullError(f"Job queue of token {key} is full")
+
+        job = Job(key, name, run)
+        queue.append(job)
+        if key not in self._workers:
+            self._workers[key] = self._hass.async_create_background_task(
+                self._async_worker(key), f"{DOMAIN} worker {key}"
+            )
+        return job
+
+    def queued(self, key: str) -> int:
+        """Return the number of jobs waiting for token `key`."""
+        return len(self._queues.get(key, ()))
+
+    def running(self, key: str) -> Job | None:
+        """Return the job currently running for token `key`."""
+        return self._running.get(key)
+
+    def is_busy(self, name: str) -> bool:
+        """Return True if cron `name` has a job queued or running."""
+        return any(job.name == name for job in self._running.values()) or any(
+            job.name == name for queue in self._queues.values() for job in queue
+        )
+
+    async def _async_worker(self, key: str) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                job = queue.popleft()
+                self._running[key] = job
+                job.started = time.monotonic()
+                try:
+                    await job.run()
+                except Exception as err:  # pylint: disable=broad-except
+                    _LOGGER.exception("Job %s of %s failed", job.job_id, job.name)
+                    job.done.set_exception(err)
+                else:
+                    job.done.set_result(None)
+                finally:
+                    if not job.done.done():
+                        job.done.cancel()
+                    elif not job.done.cancelled():
+                        # Nobody has to await the outcome of a job
+                        job.done.exception()
+                    del self._running[key]
+        finally:
+            del self._workers[key]
+
+    async def async_shutdown(self) -> None:
+        """Cancel the workers and drop the queued jobs."""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for job in queue:
+                job.done.cancel()
+        self._queues.clear()
+
+
+def async_get_scheduler(hass: HomeAssistant) -> JobScheduler:
+    """Return the scheduler shared by every entry."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_SCHEDULER not in data:
+        scheduler = data[DATA_SCHEDULER] = JobScheduler(hass)
+
+        async def _async_shutdown(_event) -> None:
+            await scheduler.async_shutdown()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_shutdown)
+    return data[DATA_SCHEDULER]
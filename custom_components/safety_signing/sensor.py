@@ -14,8 +14,15 @@ from homeassistant.const import (
     PERCENTAGE,
 )
 from homeassistant.components.device_automation.const import CONF_IS_OFF, CONF_IS_ON
+from homeassistant.core import callback
 from homeassistant.helpers.entity import Entity
 from homeassistant.components.binary_sensor import BinarySensorEntity
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.const import UnitOfTime
 from .const import DOMAIN
 
 
@@ -28,15 +35,37 @@ from .const import DOMAIN
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Add sensors for passed config_entry in HA."""
-    token = hass.data[DOMAIN][config_entry.entry_id]
+    group = hass.data[DOMAIN][config_entry.entry_id]
 
-    new_devices = []
-    for cron in token.crons:
-        new_devices.append(BatterySensor(cron))
+    # See light.py, entities of a token are added once it is active
+    @callback
+    def async_add_token(token):
+        new_devices = []
+        for cron in token.crons:
+            new_devices.append(BatterySensor(cron))
+            new_devices.append(AutoSignDurationSensor(cron))
+            new_devices.append(GetInfoLatencySensor(cron))
+            new_devices.append(SuccessRateSensor(cron))
+            new_devices.append(QueueDepthSensor(cron))
+            new_devices.append(RateLimitWaitSensor(cron))
             # new_devices.append(IlluminanceSensor(cron))
             # hass.data[DOMAIN][config_entry.entry_id].set_installed()
-    if new_devices:
-        async_add_entities(new_devices)
+        if new_devices:
+            async_add_entities(new_devices)
+
+    config_entry.async_on_unload(group.async_add_listener(async_add_token))
+
+
+def cron_device_info(cron, name):
+    """Return the device info shared by every entity of a cron."""
+    return {
+        "identifiers": {(DOMAIN, cron.cron_id)},
+        # If desired, the name for the device could be different to the entity
+        "name": name,
+        "sw_version": cron.firmware_version,
+        "model": cron.model,
+        "manufacturer": cron.token.manufacturer,
+    }
 
 
 # This base class shows the common properties and methods for a sensor as used in this
@@ -58,14 +87,7 @@ class SensorBase(BinarySensorEntity):
     @property
     def device_info(self):
         """Return information to link this entity with the correct device."""
-        return {
-            "identifiers": {(DOMAIN, self._cron.cron_id)},
-            # If desired, the name for the device could be different to the entity
-            "name": self.name,
-            "sw_version": self._cron.firmware_version,
-            "model": self._cron.model,
-            "manufacturer": self._cron.token.manufacturer,
-        }
+        return cron_device_info(self._cron, self.name)
 
 class BatterySensor(SensorBase):
     """Representation of a Sensor."""
@@ -110,5 +132,133 @@ class BatterySensor(SensorBase):
         """Return true if the binary sensor is on."""
         return self._state
 
-# This is another sensor, but more simple compared to the battery above. See the
-# comments above for how each field works.
\ No newline at end of file
+
+# The metric sensors below publish the request metrics collected by the token of the
+# cron. They are pushed in batches by TokenMetrics rather than polled.
+class MetricSensorBase(SensorEntity):
+    """Base representation of a token metric sensor."""
+
+    should_poll = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, cron, key, name):
+        """Initialize the sensor."""
+        self._cron = cron
+        self._metrics = cron.token.metrics
+        self._attr_unique_id = f"{cron.cron_id}_{key}"
+        self._attr_name = name
+
+    @property
+    def device_info(self):
+        """Return information to link this entity with the correct device."""
+        return cron_device_info(self._cron, self.name)
+
+    async def async_added_to_hass(self) -> None:
+        """Run when this Entity has been added to HA."""
+        self.async_on_remove(self._metrics.async_add_listener(self.async_write_ha_state))
+
+
+class AutoSignDurationSensor(MetricSensorBase):
+    """Duration of the last autoSign run, with the latency histogram as attributes."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_suggested_display_precision = 2
+
+    def __init__(self, cron):
+        """Initialize the sensor."""
+        super().__init__(cron, "autosign_duration", "autoSign duration")
+
+    @property
+    def native_value(self):
+        """Return the duration of the last run."""
+        return self._metrics.last_run_duration
+
+    @property
+    def extra_state_attributes(self):
+        """Return the latency histogram."""
+        return {**self._metrics.auto_sign.as_dict(), "last_run": self._metrics.last_run}
+
+
+class GetInfoLatencySensor(MetricSensorBase):
+    """Mean getInfo latency, with the latency histogram as attributes."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_suggested_display_precision = 3
+
+    def __init__(self, cron):
+        """Initialize the sensor."""
+        super().__init__(cron, "getinfo_latency", "getInfo latency")
+
+    @property
+    def native_value(self):
+        """Return the mean latency."""
+        return self._metrics.get_info.as_dict()["mean"]
+
+    @property
+    def extra_state_attributes(self):
+        """Return the latency histogram."""
+        return self._metrics.get_info.as_dict()
+
+
+class SuccessRateSensor(MetricSensorBase):
+    """Share of successful autoSign runs, failures by class as attributes."""
+
+    _attr_native_unit_of_measurement = PERCENTAGE
+    _attr_icon = "mdi:check-decagram"
+
+    def __init__(self, cron):
+        """Initialize the sensor."""
+        super().__init__(cron, "success_rate", "autoSign success rate")
+
+    @property
+    def native_value(self):
+        """Return the success rate."""
+        return self._metrics.success_rate
+
+    @property
+    def extra_state_attributes(self):
+        """Return the success, failure and document counters."""
+        return {
+            "successes": self._metrics.successes,
+            "failures": dict(self._metrics.failures),
+            "documents": dict(self._metrics.documents),
+        }
+
+
+class QueueDepthSensor(MetricSensorBase):
+    """Jobs queued or running on the token of the cron."""
+
+    _attr_icon = "mdi:tray-full"
+
+    def __init__(self, cron):
+        """Initialize the sensor."""
+        super().__init__(cron, "queue_depth", "Job queue depth")
+
+    @property
+    def native_value(self):
+        """Return the number of queued and running jobs."""
+        return self._cron.queued_jobs
+
+
+class RateLimitWaitSensor(MetricSensorBase):
+    """Mean wait for the rate limiter of the API host, histogram as attributes."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_suggested_display_precision = 3
+
+    def __init__(self, cron):
+        """Initialize the sensor."""
+        super().__init__(cron, "rate_limit_wait", "Rate limit wait")
+
+    @property
+    def native_value(self):
+        """Return the mean wait."""
+        return self._metrics.queue_wait.as_dict()["mean"]
+
+    @property
+    def extra_state_attributes(self):
+        """Return the wait histogram."""
+        return self._metrics.queue_wait.as_dict()
@@ -0,0 +1,103 @@
+"""Services of the Safety Signing integration."""
+from __future__ import annotations
+
+from functools import partial
+
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DEFAULT_PROFILE_DURATION,
+    DOMAIN,
+    HISTORY_MAX_PAGE_SIZE,
+    HISTORY_PAGE_SIZE,
+    MAX_PROFILE_DURATION,
+    SERVICE_GET_HISTORY,
+    SERVICE_PROFILE,
+)
+from .history import async_get_history
+from .profiler import MODE_DETERMINISTIC, MODE_SAMPLING, async_profile
+
+ATTR_TOKEN_SERIAL = "token_serial"
+ATTR_SINCE = "since"
+ATTR_UNTIL = "until"
+ATTR_LIMIT = "limit"
+ATTR_CURSOR = "cursor"
+ATTR_DOCUMENTS = "documents"
+ATTR_MODE = "mode"
+ATTR_DURATION = "duration"
+ATTR_RUNS = "runs"
+
+GET_HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_TOKEN_SERIAL): vol.All(cv.string, vol.Upper),
+        vol.Optional(ATTR_SINCE): cv.datetime,
+        vol.Optional(ATTR_UNTIL): cv.datetime,
+        vol.Optional(ATTR_LIMIT, default=HISTORY_PAGE_SIZE): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=HISTORY_MAX_PAGE_SIZE)
+        ),
+        vol.Optional(ATTR_CURSOR): vol.Coerce(int),
+        vol.Optional(ATTR_DOCUMENTS, default=False): cv.boolean,
+    }
+)
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_MODE, default=MODE_SAMPLING): vol.In([MODE_SAMPLING, MODE_DETERMINISTIC]),
+        vol.Optional(ATTR_DURATION, default=DEFAULT_PROFILE_DURATION): vol.All(
+            vol.Coerce(float), vol.Range(min=1, max=MAX_PROFILE_DURATION)
+        ),
+        vol.Optional(ATTR_RUNS): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    }
+)
+
+
+async def _async_get_history(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Return a page of runs, newest first, and the cursor of the next page."""
+    limit = call.data[ATTR_LIMIT]
+    since, until = call.data.get(ATTR_SINCE), call.data.get(ATTR_UNTIL)
+    # One more run than asked tells whether there is a next page
+    runs = await async_get_history(hass).async_query(
+        token_serial=call.data.get(ATTR_TOKEN_SERIAL),
+        since=dt_util.as_timestamp(since) if since else None,
+        until=dt_util.as_timestamp(until) if until else None,
+        before_id=call.data.get(ATTR_CURSOR),
+        limit=limit + 1,
+        documents=call.data[ATTR_DOCUMENTS],
+    )
+    return {
+        "runs": runs[:limit],
+        "next_cursor": runs[limit - 1]["id"] if len(runs) > limit else None,
+    }
+
+
+async def _async_profile(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Profile until the duration elapsed or the runs completed, return the file written."""
+    path = await async_profile(
+        hass, call.data[ATTR_MODE], call.data[ATTR_DURATION], call.data.get(ATTR_RUNS)
+    )
+    return {"path": path}
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the services once for every entry."""
+    if hass.services.has_service(DOMAIN, SERVICE_GET_HISTORY):
+        return
+    # ServiceCall only has its hass from 2025.1 on
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE,
+        partial(_async_profile, hass),
+        schema=PROFILE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_HISTORY,
+        partial(_async_get_history, hass),
+        schema=GET_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
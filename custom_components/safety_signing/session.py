@@ -0,0 +1,144 @@
+"""Signing sessions of the USB tokens, opened once and reused until they expire."""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+
+from .api import ApiClient, ApiError, ApiLoginError, ApiNotFoundError, ApiResponseError
+from .const import (
+    API_KEY,
+    DATA_SESSIONS,
+    DEFAULT_SESSION_TTL,
+    DOMAIN,
+    SESSION_CLOSE_PATH,
+    SESSION_OPEN_PATH,
+    SESSION_REFRESH_MARGIN,
+)
+from .ratelimit import RateLimiter
+from .singleflight import SingleFlight
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SigningSession:
+    """PKCS#11 login of one token, held by the API behind a session handle.
+
+    Requests carry the handle instead of the PIN. The handle is renewed
+    `SESSION_REFRESH_MARGIN` seconds before its TTL runs out, or right away when
+    the API reports it expired. Concurrent callers share the same login.
+    """
+
+    def __init__(
+        self,
+        client: ApiClient,
+        token_serial: str,
+        pin: str,
+        ttl: float = DEFAULT_SESSION_TTL,
+        rate_limiter: RateLimiter | None = None,
+    ) -> None:
+        """Init session, opened on first use, through `rate_limiter` if given."""
+        self._client = client
+        self._rate_limiter = rate_limiter
+        self._token_serial = token_serial
+        self._pin = pin
+        self._ttl = ttl
+        self._handle: str | None = None
+        self._expires = 0.0
+        self._opening: SingleFlight[str | None] = SingleFlight()
+        # Tokens using the session, see async_get_session
+        self._users = 0
+        # The API has no sessions, requests carry the PIN as before
+        self._unsupported = False
+
+    async def async_credentials(self) -> dict[str, Any]:
+        """Return the part of a request body that logs into the token."""
+        if (handle := await self.async_get()) is None:
+            return {"pin": self._pin}
+        return {"session": handle}
+
+    async def async_get(self) -> str | None:
+        """Return a live session handle, None when the API has no sessions."""
+        if self._unsupported:
+            return None
+        if self._handle is not None and time.monotonic() < self._expires:
+            return self._handle
+        return await self._opening.async_call(self._async_open)
+
+    async def _async_open(self) -> str | None:
+        wait = await self._rate_limiter.async_acquire() if self._rate_limiter is not None else 0.0
+        try:
+            response = await self._client.post(SESSION_OPEN_PATH, {
+                "api_key": API_KEY,
+                "token_serial": self._token_serial,
+                "pin": self._pin
+            }, queue_wait=wait)
+        except ApiNotFoundError:
+            _LOGGER.info("Signing API has no sessions, sending the PIN with every request")
+            self._unsupported = True
+            return None
+        if not isinstance(response, dict):
+            raise ApiResponseError(f"Empty session answer for token {self._token_serial}")
+        data = response.get("data") or {}
+        if response.get("status") != 0 or not data.get("session"):
+            raise ApiLoginError(
+                f"Could not open a session on token {self._token_serial}: {response.get('message')}"
+            )
+        ttl = min(float(data.get("expires_in") or self._ttl), self._ttl)
+        self._handle = data["session"]
+        self._expires = time.monotonic() + max(ttl - SESSION_REFRESH_MARGIN, 0)
+        _LOGGER.debug("Session opened on token %s for %ss", self._token_serial, ttl)
+        return self._handle
+
+    def invalidate(self, credentials: dict[str, Any]) -> None:
+        """Forget the handle `credentials` carried, the API said it expired."""
+        if credentials.get("session") == self._handle:
+            self._handle = None
+
+    async def async_close(self) -> None:
+        """Log out of the token, errors are ignored."""
+        if (handle := self._handle) is None:
+            return
+        self._handle = None
+        try:
+            await self._client.post(SESSION_CLOSE_PATH, {"api_key": API_KEY, "session": handle})
+        except ApiError as err:
+            _LOGGER.debug("Could not close session of token %s: %s", self._token_serial, err)
+
+
+def async_get_session(
+    hass: HomeAssistant,
+    client: ApiClient,
+    token_serial: str,
+    pin: str,
+    rate_limiter: RateLimiter | None = None,
+) -> SigningSession:
+    """Return the session shared by every token of `token_serial` on the host of `client`.
+
+    Every call counts one more user, to give back with async_release_session.
+    Entries giving another PIN get a session of their own, so a wrong PIN only
+    fails its own entry.
+    """
+    sessions: dict[tuple[str, str, str], SigningSession] = hass.data.setdefault(
+        DOMAIN, {}
+    ).setdefault(DATA_SESSIONS, {})
+    key = (client.host, token_serial, pin)
+    if key not in sessions:
+        sessions[key] = SigningSession(client, token_serial, pin, rate_limiter=rate_limiter)
+    session = sessions[key]
+    session._users += 1
+    return session
+
+
+async def async_release_session(hass: HomeAssistant, session: SigningSession) -> None:
+    """Count one user less, the last one logs out and forgets the session."""
+    session._users -= 1
+    if session._users > 0:
+        return
+    sessions = hass.data.get(DOMAIN, {}).get(DATA_SESSIONS, {})
+    key = (session._client.host, session._token_serial, session._pin)
+    if sessions.get(key) is session:
+        del sessions[key]
+    await session.async_close()
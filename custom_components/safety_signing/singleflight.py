@@ -0,0 +1,43 @@
+"""Calls shared by the concurrent callers asking for the same thing."""
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable, Hashable
+import asyncio
+from typing import Generic, TypeVar
+
+_T = TypeVar("_T")
+
+
+class SingleFlight(Generic[_T]):
+    """Run one call per key at a time, concurrent callers share its outcome.
+
+    The first caller runs the call, the others wait for its result or error.
+    Nothing is kept once the call is done. A waiter being cancelled does not
+    cancel the call.
+    """
+
+    def __init__(self) -> None:
+        """Init with no call in flight."""
+        self._pending: dict[Hashable, asyncio.Future[_T]] = {}
+
+    async def async_call(self, func: Callable[[], Awaitable[_T]], key: Hashable = None) -> _T:
+        """Return the outcome of `func()`, or of the call already running for `key`."""
+        if (pending := self._pending.get(key)) is not None:
+            return await asyncio.shield(pending)
+
+        future = self._pending[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # Only waiters care about the error
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._pending[key]
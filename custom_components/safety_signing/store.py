@@ -0,0 +1,67 @@
+"""Last-known-good token validation results kept in HA storage."""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import DATA_VALIDATION_STORE, DOMAIN
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.validation"
+# Results of many entries revalidating at startup end up in a single write
+SAVE_DELAY = 10
+
+
+class ValidationStore:
+    """Validation result of every token, keyed by token and cert serial."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Init store."""
+        self._store: Store[dict[str, Any]] = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._data: dict[str, dict[str, Any]] = {}
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+
+    @staticmethod
+    def key(token_serial: str, serial_number: str) -> str:
+        """Return the key of a token/cert pair."""
+        return f"{token_serial.upper()}:{serial_number.upper()}"
+
+    async def async_load(self) -> None:
+        """Load the stored results once."""
+        async with self._load_lock:
+            if not self._loaded:
+                self._data = await self._store.async_load() or {}
+                self._loaded = True
+
+    def get(self, token_serial: str, serial_number: str) -> bool | None:
+        """Return the last known result, None if the token was never checked."""
+        result = self._data.get(self.key(token_serial, serial_number))
+        return None if result is None else result["valid"]
+
+    def set(self, token_serial: str, serial_number: str, valid: bool) -> None:
+        """Record a result and schedule a save."""
+        self._data[self.key(token_serial, serial_number)] = {
+            "valid": valid,
+            "checked": time.time(),
+        }
+        self._store.async_delay_save(lambda: self._data, SAVE_DELAY)
+
+    def remove(self, token_serial: str, serial_number: str) -> None:
+        """Forget a token, used when its entry is removed."""
+        if self._data.pop(self.key(token_serial, serial_number), None) is not None:
+            self._store.async_delay_save(lambda: self._data, SAVE_DELAY)
+
+
+async def async_get_validation_store(hass: HomeAssistant) -> ValidationStore:
+    """Return the loaded store shared by every entry."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_VALIDATION_STORE not in data:
+        data[DATA_VALIDATION_STORE] = ValidationStore(hass)
+    store: ValidationStore = data[DATA_VALIDATION_STORE]
+    await store.async_load()
+    return store
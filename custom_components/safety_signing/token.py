@@ -8,19 +8,104 @@ from __future__ import annotations
 # This dummy token always returns 1 cron.
 import asyncio
 import json
-import random
-import requests
-from homeassistant.core import HomeAssistant
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from functools import partial
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 import logging
-from .const import API_KEY, API_IP
+from .api import ApiClient, ApiConnectionError, ApiError, ApiLoginError, ApiNotFoundError, async_get_client
+from .auth import AccessTokenManager
+from .history import DocumentLog, JobHistory, RunRecord
+from .cache import TokenInfo, TokenInfoCache, async_get_info_cache
+from .image_store import ImageStore, async_get_image_store
+from .ratelimit import RateLimiter, async_get_rate_limiter
+from .metrics import TokenMetrics, error_class
+from .offline import OfflineQueue
+from .retry import RetryPolicy
+from .schedule import Schedule
+from .session import SigningSession, async_get_session, async_release_session
+from .scheduler import Job, JobScheduler, QueueFullError, async_get_scheduler
+from .store import ValidationStore
+from .const import API_KEY, API_IP, DEFAULT_APP_CONCURRENCY, ERROR_IMAGE_NOT_FOUND, ERROR_SESSION_EXPIRED, ERROR_TOKEN_NOT_FOUND, IDEMPOTENCY_HEADER, REPLAY_INTERVAL, IMAGE_HASH, PROGRESS_IDLE_TIMEOUT
+from .progress import EVENT_DISCONNECTED
+from .publisher import StatePublisher, async_get_publisher
 _LOGGER = logging.getLogger(__name__)
 
+
+def token_configs(input_config: dict) -> list[dict]:
+    """Return the config of every token described by an entry json config.
+
+    The config either describes a single token at the top level, or holds a `tokens`
+    list whose items override the top level values for each token.
+    """
+    if "tokens" not in input_config:
+        return [input_config]
+    defaults = {key: value for key, value in input_config.items() if key != "tokens"}
+    return [{**defaults, **token} for token in input_config["tokens"]]
+
+
+def make_cron_id(name: str, serial_number: str) -> str:
+    """Return the id of the cron of a token of entry `name`, its offline runs are kept under it."""
+    return name.replace(" ", "_").lower() + "_" + serial_number.upper()
+
+
+def clean_tax_ids(tax_ids: list[str]) -> list[str]:
+    """Return the valid tax ids, without dashes."""
+    cleaned = []
+    for tax_id in tax_ids:
+        if tax_id.replace("-", "").isnumeric() and len(tax_id.replace("-", "")) >= 10 and len(tax_id.replace("-", "")) <= 16:
+            cleaned.append(tax_id.replace("-", ""))
+    return cleaned
+
+
+class TokenGroup:
+    """Tokens of one config entry.
+
+    Entities of a token are only created once it is known to be valid, so tokens
+    that are unplugged or misconfigured cost nothing but their Token object.
+    """
+
+    def __init__(self, tokens: list[Token]) -> None:
+        """Init group, tokens valid as of their last known state are active."""
+        self.tokens = tokens
+        self._active = [token for token in tokens if token.online]
+        self._listeners: list[Callable[[Token], None]] = []
+
+    @property
+    def crons(self) -> list[Crons]:
+        """Return the crons of every token."""
+        return [cron for token in self.tokens for cron in token.crons]
+
+    @callback
+    def async_add_listener(self, add_token: Callable[[Token], None]) -> CALLBACK_TYPE:
+        """Call `add_token` for every active token and every token turning active."""
+        self._listeners.append(add_token)
+        for token in self._active:
+            add_token(token)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(add_token)
+
+        return remove_listener
+
+    async def async_revalidate(self) -> None:
+        """Revalidate every token and activate the ones found valid."""
+        await asyncio.gather(*(token.async_revalidate() for token in self.tokens))
+        for token in self.tokens:
+            if token.online and token not in self._active:
+                self._active.append(token)
+                for add_token in list(self._listeners):
+                    add_token(token)
+
+
 class Token:
     """Dummy token for Hello World example."""
 
     manufacturer = "SAFEcert Corp"
 
-    def __init__(self, hass: HomeAssistant, name: str, api_ip_address: str, pdf_options: str, tax_ids: str, token_serial: str, serial_number: str, access_token: str, pin: str, app: str) -> None:
+    def __init__(self, hass: HomeAssistant, name: str, api_ip_address: str, pdf_options: dict, tax_ids: list[str], token_serial: str, serial_number: str, access_token: dict, pin: str, app: str, client: ApiClient | None = None, scheduler: JobScheduler | None = None, info_cache: TokenInfoCache | None = None, validation_store: ValidationStore | None = None, image_store: ImageStore | None = None, auth: AccessTokenManager | None = None, retry_policy: RetryPolicy | None = None, schedule: dict | None = None, split_apps: bool = False, app_concurrency: int = DEFAULT_APP_CONCURRENCY, history: JobHistory | None = None, rate_limiter: RateLimiter | None = None, offline_queue: OfflineQueue | None = None, session: SigningSession | None = None) -> None:
         """Init dummy token."""
         serial_number = serial_number.upper()
         token_serial = token_serial.upper()
@@ -28,54 +113,178 @@ class Token:
         self._api_ip_address = api_ip_address
         self._token_serial = token_serial
         self._serial_number = serial_number
-        self._access_token = json.loads(access_token)
-        self._pdf_options = json.loads(pdf_options)
-        self._tax_ids = json.loads(tax_ids)
+        self._access_token = access_token
+        self._pdf_options = pdf_options
+        self._tax_ids = tax_ids
         self._pin = pin
         self._app = app
         self._hass = hass
+        self._client = client or async_get_client(hass, api_ip_address)
+        self._scheduler = scheduler or async_get_scheduler(hass)
+        self._info_cache = info_cache or async_get_info_cache(hass)
+        self._image_store = image_store or async_get_image_store(hass)
+        self._auth = auth
+        self._retry_policy = retry_policy or RetryPolicy()
+        self.metrics = TokenMetrics(hass)
+        self._schedule = schedule
+        self._split_apps = split_apps
+        self._app_concurrency = max(int(app_concurrency), 1)
+        self._history = history
+        self._rate_limiter = rate_limiter or async_get_rate_limiter(hass, api_ip_address)
+        self._offline_queue = offline_queue
+        self._replaying = False
+        # Every request of the token logs in through this session rather than the PIN,
+        # shared with the other entries on the same token unless one is given
+        self._shared_session = session is None
+        self._session = session or async_get_session(
+            hass, self._client, token_serial, pin, self._rate_limiter
+        )
         self._id = name.replace(" ", "_").lower()
         self._installed = False
         self._is_valid_token = False
-        cron_id = f"{self._id}_"+serial_number
+        self._validation_store = validation_store
+        if validation_store is not None:
+            # Start from the last known result, a token never checked yet is the
+            # one the config flow has just validated
+            self._is_valid_token = validation_store.get(token_serial, serial_number) is not False
+        cron_id = make_cron_id(name, serial_number)
         cron_name = "Token ****" + serial_number[-7:] + " App:" + app.replace(';', ',')
         self.crons = [
             Crons(cron_id, cron_name, self),
         ]
-        self.online = True
 
     async def check_serial_exists(self):
-        requestHeaders = {
-            "Content-Type": "application/json",
-        }
-        requestBody = {
-            "pin": self._pin,
-            "api_key": API_KEY,
-            "token_serial": self._token_serial
-        }
-        requestURL = "http://" + self._api_ip_address + ":3000/api/token/getInfo"
-        # future = self._loop.run_in_executor(None, requests.post, requestURL, data=json.dumps(requestBody), headers=requestHeaders)
         try:
-            response = await self._hass.async_add_executor_job(lambda: requests.post(requestURL, data=json.dumps(requestBody), headers=requestHeaders))
-            response = response.json()
-        except:
-            """"""
-            response = {
-                "status":1,
-                "message":"Could not connect to API or timeout"
+            return await self._async_check_serial()
+        except ApiError as err:
+            _LOGGER.error(err)
+            self._enable = "off"
+            return False
+
+    async def _async_check_serial(self) -> bool:
+        info = await self._info_cache.async_get(self._token_serial, self._async_fetch_info)
+        self._is_valid_token = info is not None and info.has_cert(self._serial_number)
+        return self._is_valid_token
+
+    async def async_revalidate(self) -> bool:
+        """Check the token against the API, record the result and refresh entities.
+
+        A getInfo answer younger than the cache TTL is trusted, like the one the
+        config flow just fetched. When the API can not be reached the last known
+        result is kept.
+        """
+        try:
+            valid = await self._async_check_serial()
+        except ApiError as err:
+            _LOGGER.warning("Token %s keeps its last known state: %s", self._token_serial, err)
+            return self._is_valid_token
+        if self._validation_store is not None:
+            self._validation_store.set(self._token_serial, self._serial_number, valid)
+        _LOGGER.info("Token %s validated: %s", self._token_serial, valid)
+        for cron in self.crons:
+            cron.async_publish_updates()
+        return valid
+
+    async def _async_fetch_info(self) -> TokenInfo | None:
+        """Enumerate the token through getInfo, None when the API refused."""
+        async def fetch(credentials: dict) -> dict:
+            requestBody = {
+                "api_key": API_KEY,
+                "token_serial": self._token_serial,
+                **credentials
             }
+            wait = await self.async_rate_limit()
+            return await self._client.post("/api/token/getInfo", requestBody, queue_wait=wait)
+
+        start = time.monotonic()
+        try:
+            response = await self.async_with_session(fetch)
+        except ApiLoginError as err:
+            # The token is there but refuses the PIN, it can not sign
+            _LOGGER.error(err)
+            self._enable = "off"
+            return None
+        finally:
+            self.metrics.record_get_info(time.monotonic() - start)
+
+        if not response or "status" not in response or response["status"] != 0:
+            _LOGGER.error(response.get("message") if response else "Empty getInfo answer")
+            self._enable = "off"
+            return None
+        return TokenInfo.from_response(response)
+
+    async def async_with_session(self, call: Callable[[dict], Awaitable[dict]]) -> dict:
+        """Return `call(credentials)`, called again on a new session if the API says it expired."""
+        credentials = await self._session.async_credentials()
+        response = await call(credentials)
+        if response and response.get("error") == ERROR_SESSION_EXPIRED:
+            self._session.invalidate(credentials)
+            response = await call(await self._session.async_credentials())
+        return response
+
+    async def async_replay(self) -> None:
+        """Run the crons whose last run could not reach the API, oldest first.
+
+        Stops at the first replayed run that fails to reach the API again, it
+        stays at the head of the queue for the next replay.
+        """
+        if self._offline_queue is None or self._replaying or not self.online:
+            return
+        self._replaying = True
+        try:
+            # Runs of other entries on the same token serial are theirs to replay
+            crons = {cron.cron_id: cron for cron in self.crons}
+            while (jobs := self._offline_queue.jobs(self._token_serial, crons)) and self._client.available:
+                pending = jobs[0]
+                cron = crons[pending["cron_id"]]
+                _LOGGER.info("%s: replaying run %s queued while the API was unreachable", cron.name, pending["run_id"])
+                if (job := cron.schedule_run(pending["run_id"])) is None:
+                    break
+                await asyncio.wait({job.done})
+                jobs = self._offline_queue.jobs(self._token_serial, crons)
+                if jobs and jobs[0]["cron_id"] == pending["cron_id"]:
+                    break
+                await asyncio.sleep(REPLAY_INTERVAL)
+        finally:
+            self._replaying = False
+
+    @callback
+    def async_apply_options(self, pdf_options: dict, tax_ids: list[str], app: str) -> None:
+        """Sign with new options from now on, keeping the token, its jobs and entities.
+
+        Only the cached config part of the autoSign bodies is dropped, and only
+        when something changed.
+        """
+        if (pdf_options, tax_ids, app) == (self._pdf_options, self._tax_ids, self._app):
+            return
+        self._pdf_options = pdf_options
+        self._tax_ids = tax_ids
+        self._app = app
+        for cron in self.crons:
+            cron.set_config(tax_ids, app)
+        _LOGGER.info("Token %s options updated", self._token_serial)
+
+    async def async_close(self) -> None:
+        """Close the signing session of the token, once no other token uses it."""
+        if self._shared_session:
+            await async_release_session(self._hass, self._session)
+        else:
+            await self._session.async_close()
+
+    async def async_rate_limit(self) -> float:
+        """Wait for the rate limiter of the API host, record and return the wait."""
+        wait = await self._rate_limiter.async_acquire()
+        self.metrics.record_queue_wait(wait)
+        return wait
+
+    def invalidate_info(self) -> None:
+        """Drop the cached getInfo answer so the next check asks the API."""
+        self._info_cache.invalidate(self._token_serial)
 
-        if response:
-            if "status" not in response or response["status"] != 0:
-                _LOGGER.exception(response["message"])
-                self._enable = "off"
-            elif "data" in response and "certs" in response["data"]:
-                for signature in response["data"]["certs"]:
-                    if "SerialNumber" in signature and signature["SerialNumber"] == self._serial_number:
-                        self._is_valid_token = True
-        
+    @property
+    def online(self) -> bool:
+        """Token holds the configured cert, as of the last validation."""
         return self._is_valid_token
-            
 
     @property
     def token_id(self) -> str:
@@ -104,6 +313,8 @@ class Crons:
         self.tax_ids = token._tax_ids
         self._callbacks = set()
         self._loop = asyncio.get_event_loop()
+        # Taken on first publish, a token built by the config flow never publishes
+        self._publisher: StatePublisher | None = None
         self._target_position = 100
         self._current_position = 100
         self._enable = "on"
@@ -115,6 +326,29 @@ class Crons:
         self.firmware_version = "0.0.1"
         self.model = "SafetySigning token cron"
 
+        # Documents of the current or last run, pushed by the API progress stream.
+        # Counted per app of a split run, `progress` is their sum
+        self.progress = {"found": 0, "signed": 0, "failed": 0}
+        self._run_progress: dict[str, dict[str, int]] = {}
+        # Document records of the current run, of the attempts that answered
+        self._run_documents = DocumentLog()
+
+        # Built-in schedule of the cron, runs without any automation when set
+        self.schedule: Schedule | None = None
+        if token._schedule:
+            try:
+                self.schedule = Schedule.from_config(token._schedule, cronid)
+            except (AttributeError, TypeError, ValueError) as err:
+                _LOGGER.error("%s: invalid schedule ignored: %s", name, err)
+
+        # Encoded json of the parts of the autoSign body that do not change between
+        # runs, built on first use and dropped when the config changes. Keyed by
+        # app for split runs, None holds the config with every app
+        self._config_json: dict[str | None, bytes] = {}
+        # Login part of the token config, the session handle once the API grants one
+        self._config_credentials: dict = {"pin": self.pin}
+        self._access_token_json: bytes | None = None
+
     @property
     def get_name(self) -> str:
         return self.name
@@ -149,57 +383,310 @@ class Crons:
         """
         Set dummy cover to the given position.
 
-        State is announced a random number of seconds later.
+        State is announced with the next batch of state writes.
         """
         self._target_position = position
 
         # Update the moving status, and broadcast the update
         self.moving = position - 50
-        await self.publish_updates()
+        self.async_publish_updates()
 
-        self._loop.create_task(self.delayed_update())
+        await self.delayed_update()
 
-    async def running_cron(self) -> None:
-        requestHeaders = {
-            "Content-Type": "application/json",
-        }
-        requestBody = {
-            "google_token": self.access_token,
-            "config": {
-                "token": {
-                    "tax_ids": self.tax_ids,
-                    "tokenSerial": self.token_serial,
-                    "serialNumber": self.serial_number,
-                    "pin": self.pin,
-                    "app": json.dumps(self.app.split(';'))
-                }
+    def schedule_run(self, run_id: str | None = None) -> Job | None:
+        """Queue a run of this cron on the token scheduler and return right away.
+
+        `run_id` replays a run under its idempotency key.
+        """
+        try:
+            job = self.token._scheduler.enqueue(self.token_serial, self._id, partial(self._async_run_job, run_id))
+        except QueueFullError as err:
+            _LOGGER.warning("%s: %s, trigger dropped", self.name, err)
+            return None
+        self.token.metrics.async_mark_changed()
+        self.async_publish_updates()
+        return job
+
+    @callback
+    def scheduled_run(self) -> None:
+        """Run of the built-in schedule, skipped while the cron or token is off."""
+        if self._enable == "on" and self.token.online:
+            self.schedule_run()
+
+    async def _async_run_job(self, run_id: str | None = None) -> None:
+        try:
+            await self.running_cron(run_id)
+        finally:
+            self.token.metrics.async_mark_changed()
+            self.async_publish_updates()
+
+    @property
+    def queued_jobs(self) -> int:
+        """Return the number of jobs waiting or running on the token of this cron."""
+        scheduler = self.token._scheduler
+        return scheduler.queued(self.token_serial) + (scheduler.running(self.token_serial) is not None)
+
+    @property
+    def is_running(self) -> bool:
+        """Return True while a run of this cron is queued or in progress."""
+        return self.token._scheduler.is_busy(self._id)
+
+    @property
+    def apps(self) -> list[str]:
+        """Return the apps this cron signs for."""
+        return [app for app in self.app.split(';') if app]
+
+    def _build_config_json(self, app: str | None = None) -> bytes:
+        config = {
+            "token": {
+                "tax_ids": self.tax_ids,
+                "tokenSerial": self.token_serial,
+                "serialNumber": self.serial_number,
+                **self._config_credentials,
+                "app": json.dumps([app] if app is not None else self.app.split(';'))
             }
         }
-        if self.token._pdf_options and len(self.token._pdf_options) >= 1:
+        pdf_options = self.token._pdf_options
+        if pdf_options and len(pdf_options) >= 1:
+            config["pdf_options"] = pdf_options
             try:
-                pdf_options = self.token._pdf_options
-                requestBody["config"]["pdf_options"] = pdf_options
-                if pdf_options["y"] in ["top", "bottom"] and pdf_options["x"] in ["left", "right", "center"] and pdf_options["page"] in ["first", "last"] and pdf_options["opacity"] and pdf_options["placement"] and pdf_options["image"]["content"]:
-                    # requestBody["config"]["pdf_options"] = pdf_options
-                    """"""
-            except:
-                """over exception"""
-
-        requestURL = "http://" + self.token._api_ip_address + ":3000/api/autoSign"
-        # future = self._loop.run_in_executor(None, requests.post, requestURL, data=json.dumps(requestBody), headers=requestHeaders)
+                valid = pdf_options["y"] in ["top", "bottom"] and pdf_options["x"] in ["left", "right", "center"] and pdf_options["page"] in ["first", "last"] and pdf_options["opacity"] and pdf_options["placement"] and (pdf_options["image"].get("content") or pdf_options["image"].get(IMAGE_HASH))
+            except (AttributeError, KeyError, TypeError):
+                valid = False
+            if not valid:
+                _LOGGER.warning("%s: pdf_options look incomplete, sent as is", self.name)
+        return json.dumps(config, separators=(",", ":")).encode()
+
+    def set_config(self, tax_ids: list[str], app: str) -> None:
+        """Use new tax ids and apps, the token holds the pdf_options."""
+        self.tax_ids = tax_ids
+        self.app = app
+        self._config_json.clear()
+
+    def set_access_token(self, access_token: dict) -> None:
+        """Use a new access token, only its part of the body is encoded again."""
+        self.access_token = access_token
+        self._access_token_json = None
+
+    def request_body(self, app: str | None = None, credentials: dict | None = None, **extra) -> bytes:
+        """Return the encoded autoSign body, `extra` keys are added at the top level.
+
+        With `app` the body only asks for that app, otherwise for every app.
+        `credentials` log into the token, the PIN when not given.
+        """
+        credentials = credentials or {"pin": self.pin}
+        if credentials != self._config_credentials:
+            # A new session handle, once per session TTL
+            self._config_credentials = credentials
+            self._config_json.clear()
+        if app not in self._config_json:
+            self._config_json[app] = self._build_config_json(app)
+        if self._access_token_json is None:
+            self._access_token_json = json.dumps(self.access_token, separators=(",", ":")).encode()
+        parts = [b'{"google_token":', self._access_token_json, b',"config":', self._config_json[app]]
+        for key, value in extra.items():
+            parts += [b",", json.dumps(key).encode(), b":", json.dumps(value, separators=(",", ":")).encode()]
+        parts.append(b"}")
+        return b"".join(parts)
+
+    async def running_cron(self, run_id: str | None = None) -> None:
+        if self.token._auth is not None:
+            # Refreshed ahead of expiry, a stale token would only fail on the API side
+            access_token = await self.token._auth.async_get_access_token()
+            if access_token is not self.access_token:
+                self.set_access_token(access_token)
+        # Same key for every attempt and replay of this run so the API can drop the duplicates
+        idempotency_key = run_id or uuid.uuid4().hex
+        started = time.time()
+        start = time.monotonic()
+        self._run_progress = {}
+        self._run_documents = DocumentLog()
+        self.progress = {"found": 0, "signed": 0, "failed": 0}
+        if self.token._split_apps and len(self.apps) > 1:
+            response, error = await self._async_run_apps(idempotency_key)
+        else:
+            response, error = await self._async_run(idempotency_key)
+
+        success = bool(response) and response.get("status") == 0
+        self.token.metrics.record_auto_sign(time.monotonic() - start, success, error)
+        if self.token._history is not None:
+            self.token._history.async_append(RunRecord.from_response(
+                self._id, self.token_serial, idempotency_key, started, response,
+                None if success else error_class(error), self._run_documents,
+            ))
+        if self.token._offline_queue is not None:
+            if isinstance(error, ApiConnectionError) and not isinstance(error, ApiNotFoundError):
+                # Replayed once the API is back, see Token.async_replay. A refused
+                # login or an error answer is final and is not an ApiConnectionError
+                self.token._offline_queue.add(self.token_serial, self._id, idempotency_key)
+            else:
+                self.token._offline_queue.remove(self.token_serial, self._id)
+        if not success:
+            _LOGGER.error(response.get("message") if response else "Empty autoSign answer")
+        if isinstance(error, ApiLoginError) or (
+            response and response.get("error") == ERROR_TOKEN_NOT_FOUND
+        ):
+            # The token was unplugged or swapped, its cached getInfo answer is stale
+            self.token.invalidate_info()
+            self.token._hass.async_create_background_task(
+                self.token.async_revalidate(), f"revalidate {self.token_serial}"
+            )
+
+    async def _async_run(self, idempotency_key: str, app: str | None = None) -> tuple[dict, Exception | None]:
+        """Sign with retries, return the answer and the API error that ended it."""
         try:
-            response = await self.token._hass.async_add_executor_job(lambda: requests.post(requestURL, data=json.dumps(requestBody), headers=requestHeaders))
-            response = response.json()
-        except:
-            """"""
-            response = {
+            return await self.token._retry_policy.async_call(self._async_auto_sign, idempotency_key, app), None
+        except ApiError as err:
+            return {
                 "status": 1,
-                "message":"Could not connect to API or timeout"
-            }
+                "message": str(err)
+            }, err
 
-        if response:
-            if "status" not in response or response["status"] != 0:
-                _LOGGER.exception(response["message"])
+    async def _async_run_apps(self, idempotency_key: str) -> tuple[dict, Exception | None]:
+        """Sign every app in its own request and merge the answers.
+
+        The sub-requests run within the scheduler job of the token, so no other run
+        of the token overlaps them. They only run concurrently while the token has
+        a session handle, the API then signs for one app at a time on that single
+        session while the others fetch documents. Without sessions every request
+        logs in with the PIN, so they go one after the other.
+        """
+        scheduler = self.token._scheduler
+        try:
+            handle = await self.token._retry_policy.async_call(self.token._session.async_get)
+        except ApiError as err:
+            # Every app would fail the same way, and a refused login must not be repeated
+            return {
+                "status": 1,
+                "message": str(err)
+            }, err
+        token_limit = asyncio.Semaphore(self.token._app_concurrency if handle is not None else 1)
+
+        async def run_app(app: str) -> tuple[dict, Exception | None]:
+            async with token_limit, scheduler.app_semaphore(app):
+                return await self._async_run(f"{idempotency_key}-{app}", app)
+
+        apps = self.apps
+        results = await asyncio.gather(*(run_app(app) for app in apps))
+        answers = {app: response for app, (response, _err) in zip(apps, results)}
+        failed = [app for app, response in answers.items() if not response or response.get("status") != 0]
+        for app in failed:
+            _LOGGER.warning("%s: app %s failed: %s", self.name, app, answers[app].get("message") if answers[app] else "Empty autoSign answer")
+        error = next((err for _response, err in results if err is not None), None)
+        return {
+            "status": 1 if failed else 0,
+            "message": f"Apps failed: {', '.join(failed)}" if failed else "OK",
+            "data": {"apps": answers}
+        }, error
+
+    async def _async_auto_sign(self, idempotency_key: str, app: str | None = None) -> dict:
+        response = await self._async_post_auto_sign(idempotency_key, app)
+        if response and response.get("error") == ERROR_IMAGE_NOT_FOUND and await self._async_upload_image():
+            # The first call signed nothing, it must not be taken for a duplicate
+            response = await self._async_post_auto_sign(f"{idempotency_key}-image", app)
+        return response
+
+    async def _async_post_auto_sign(self, idempotency_key: str, app: str | None = None) -> dict:
+        return await self.token.async_with_session(
+            partial(self._async_post_auto_sign_as, idempotency_key=idempotency_key, app=app)
+        )
+
+    async def _async_post_auto_sign_as(self, credentials: dict, idempotency_key: str, app: str | None) -> dict:
+        # Documents of this attempt, only counted once it answered: a retry after
+        # a stream cut halfway gets the same documents again
+        documents = DocumentLog()
+        response = await self._async_post_attempt(credentials, idempotency_key, app, documents)
+        self._run_documents.merge(documents)
+        self.token.metrics.record_documents(documents.counts)
+        return response
+
+    async def _async_post_attempt(self, credentials: dict, idempotency_key: str, app: str | None, documents: DocumentLog) -> dict:
+        client = self.token._client
+        wait = await self.token.async_rate_limit()
+        if not await client.progress.async_connect():
+            # No progress stream, the request stays open for the whole batch and
+            # its documents are read one by one as the API streams them
+            return await client.post_stream(
+                "/api/autoSign",
+                self.request_body(app, credentials, idempotency_key=idempotency_key),
+                documents.add,
+                headers={IDEMPOTENCY_HEADER: idempotency_key},
+                queue_wait=wait,
+            )
+
+        # Subscribed before posting so that no event of the job can be missed
+        done = self.token._hass.loop.create_future()
+        last_event = [time.monotonic()]
+
+        # A retry counts the documents of its app again from zero
+        progress = self._run_progress[app or ""] = {"found": 0, "signed": 0, "failed": 0}
+
+        @callback
+        def on_event(event: dict) -> None:
+            last_event[0] = time.monotonic()
+            self._async_handle_progress(event, done, progress, documents)
+
+        unsubscribe = client.progress.subscribe(idempotency_key, on_event)
+        try:
+            response = await client.post(
+                "/api/autoSign",
+                self.request_body(app, credentials, idempotency_key=idempotency_key, **{"async": True}),
+                headers={IDEMPOTENCY_HEADER: idempotency_key},
+                queue_wait=wait,
+            )
+            if not response or response.get("status") != 0 or "job_id" not in response:
+                # Refused, or answered in full by an API signing synchronously
+                return response
+            while not done.done():
+                await asyncio.wait({done}, timeout=PROGRESS_IDLE_TIMEOUT)
+                if not done.done() and time.monotonic() - last_event[0] >= PROGRESS_IDLE_TIMEOUT:
+                    raise ApiConnectionError(f"No progress of job {idempotency_key} for {PROGRESS_IDLE_TIMEOUT}s")
+            return done.result()
+        finally:
+            unsubscribe()
+
+    @callback
+    def _async_handle_progress(self, event: dict, done: asyncio.Future, progress: dict[str, int], documents: DocumentLog) -> None:
+        kind = event.get("event")
+        if kind in ("found", "signed", "failed"):
+            if kind == "found":
+                progress["found"] = event.get("count", 0)
+            else:
+                progress[kind] += 1
+                documents.add({**(event.get("document") or {}), "status": kind})
+            self.progress = {
+                key: sum(counts[key] for counts in self._run_progress.values())
+                for key in self.progress
+            }
+        elif kind == "done" and not done.done():
+            done.set_result(event.get("result") or {"status": 0})
+        elif kind == EVENT_DISCONNECTED and not done.done():
+            # The retry posts the same idempotency key and gets the job back
+            done.set_exception(ApiConnectionError("Progress stream closed during the run"))
+        else:
+            return
+        self.async_publish_updates()
+
+    async def _async_upload_image(self) -> bool:
+        """Send the stamp image the API asked for, True once it holds it."""
+        image = (self.token._pdf_options or {}).get("image") or {}
+        if not (digest := image.get(IMAGE_HASH)):
+            return False
+        # An image still inline stands in for a stored copy gone missing
+        content = await self.token._image_store.async_get(digest) or image.get("content")
+        if content is None:
+            _LOGGER.error(
+                "%s: stamp image %s is missing from the image store, set pdf_options again",
+                self.name, digest,
+            )
+            return False
+        wait = await self.token.async_rate_limit()
+        response = await self.token._client.post("/api/image/upload", {
+            "api_key": API_KEY,
+            "hash": digest,
+            "content": content
+        }, queue_wait=wait)
+        return bool(response) and response.get("status") == 0
 
     async def turn_on_cron(self) -> None:
         self._enable = "on"
@@ -214,10 +701,9 @@ class Crons:
             self._enable = "on"
 
     async def delayed_update(self) -> None:
-        """Publish updates, with a random delay to emulate interaction with device."""
-        await asyncio.sleep(random.randint(1, 10))
+        """Publish the end of a move, written together with its start when batched."""
         self.moving = 0
-        await self.publish_updates()
+        self.async_publish_updates()
 
     def register_callback(self, callback: Callable[[], None]) -> None:
         """Register callback, called when cron changes state."""
@@ -231,23 +717,27 @@ class Crons:
     # notified of any state changeds for the relevant device.
     async def publish_updates(self) -> None:
         """Schedule call all registered callbacks."""
+        self.async_publish_updates()
+
+    @callback
+    def async_publish_updates(self) -> None:
+        """Call the registered callbacks with the next batch of state writes."""
+        if self._publisher is None:
+            self._publisher = async_get_publisher(self.token._hass)
+        self._publisher.async_schedule(self._id, self._async_write_states)
+
+    @callback
+    def _async_write_states(self) -> None:
         self._current_position = self._target_position
-        for callback in self._callbacks:
+        for callback in list(self._callbacks):
             callback()
 
     @property
-    def online(self) -> float:
-        """cron is online."""
-        # The dummy cron is offline about 10% of the time. Returns True if online,
-        # False if offline.
-        return random.random() > 0.1
+    def online(self) -> bool:
+        """Signing API behind the cron is reachable."""
+        return self.token._client.available
 
     @property
     def is_enable(self) -> bool:
         """Battery level as a percentage."""
         return self._enable
-
-    @property
-    def illuminance(self) -> int:
-        """Return a sample illuminance in lux."""
-        return random.randint(0, 500)
@@ -0,0 +1,94 @@
+"""Phase timings of the requests sent to the signing API."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import aiohttp
+
+
+@dataclass
+class RequestTrace:
+    """Timeline of one request, from waiting for a slot to the parsed answer.
+
+    Marks are monotonic timestamps set by the client and by aiohttp trace hooks,
+    a phase whose marks are missing, like dns on a reused connection, is left out.
+    The rate limiter is waited for before the client gets the request, its wait
+    is handed over in seconds and counted in the queue phase.
+    """
+
+    method: str
+    path: str
+    started: float = field(default_factory=time.time)
+    sent_bytes: int | None = None
+    received_bytes: int | None = None
+    status: int | None = None
+    error: str | None = None
+    reused: bool = False
+    rate_limit_wait: float = 0.0
+    marks: dict[str, float] = field(default_factory=dict)
+
+    def mark(self, name: str) -> None:
+        """Record that the request reached `name` now."""
+        self.marks[name] = time.monotonic()
+
+    def _between(self, start: str, end: str) -> float | None:
+        if start in self.marks and end in self.marks:
+            return round((self.marks[end] - self.marks[start]) * 1000, 2)
+        return None
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the trace with its phases in milliseconds."""
+        ready = "connected" if "connected" in self.marks else "acquired"
+        waited = round(self.rate_limit_wait * 1000, 2)
+        slot = self._between("queued", "acquired")
+        total = self._between("queued", "done")
+        phases = {
+            "rate_limit": waited or None,
+            "queue": round(waited + slot, 2) if slot is not None else None,
+            "dns": self._between("dns_start", "dns_end"),
+            "connect": self._between("connecting", "connected"),
+            "send": self._between(ready, "sent"),
+            "wait": self._between("sent", "response"),
+            "parse": self._between("response", "read"),
+            "total": round(waited + total, 2) if total is not None else None,
+        }
+        return {
+            "method": self.method,
+            "path": self.path,
+            "started": self.started,
+            "status": self.status,
+            "error": self.error,
+            "reused_connection": self.reused,
+            "sent_bytes": self.sent_bytes,
+            "received_bytes": self.received_bytes,
+            "phases_ms": {name: value for name, value in phases.items() if value is not None},
+        }
+
+
+def _hook(name: str, reused: bool = False):
+    async def on_event(
+        _session: aiohttp.ClientSession, context: SimpleNamespace, _params: Any
+    ) -> None:
+        if isinstance(trace := context.trace_request_ctx, RequestTrace):
+            trace.mark(name)
+            if reused:
+                trace.reused = True
+
+    return on_event
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    """Return the aiohttp hooks filling the RequestTrace passed as trace_request_ctx."""
+    config = aiohttp.TraceConfig()
+    config.on_dns_resolvehost_start.append(_hook("dns_start"))
+    config.on_dns_resolvehost_end.append(_hook("dns_end"))
+    config.on_connection_create_start.append(_hook("connecting"))
+    config.on_connection_create_end.append(_hook("connected"))
+    config.on_connection_reuseconn.append(_hook("connected", reused=True))
+    # Called for every chunk of the body, the last one ends the send phase
+    config.on_request_chunk_sent.append(_hook("sent"))
+    config.on_request_end.append(_hook("response"))
+    return config
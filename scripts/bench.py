@@ -0,0 +1,194 @@
+"""Throughput and latency benchmark of Token and Crons against the fake API.
+
+Starts scripts/fake_api.py in process, builds N tokens on a bare Home Assistant
+core and fires M concurrent triggers per token:
+
+    python scripts/bench.py --tokens 20 --triggers 5 --latency 0.2
+
+--split-apps sends one autoSign per app of a run instead of one for all six,
+--unix talks to the fake API over a Unix socket instead of TCP.
+
+Needs Home Assistant installed, it does not need a running instance.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_api import FakeApiOptions, make_app  # noqa: E402
+
+ACCESS_TOKEN = {
+    "access_token": "bench",
+    "expires_in": 3599,
+    "scope": "https://www.googleapis.com/auth/drive",
+    "token_type": "Bearer",
+}
+
+
+def report(name: str, latencies: list[float], elapsed: float) -> None:
+    """Print the percentiles and throughput of one phase."""
+    if len(latencies) < 2:
+        print(f"{name}: {len(latencies)} calls")
+        return
+    centiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name}: {len(latencies)} calls in {elapsed:.2f}s, "
+        f"{len(latencies) / elapsed:.1f}/s, "
+        f"p50 {centiles[49] * 1000:.1f}ms, "
+        f"p95 {centiles[94] * 1000:.1f}ms, "
+        f"p99 {centiles[98] * 1000:.1f}ms"
+    )
+
+
+class ThreadSampler:
+    """Record the peak number of live threads while a phase runs."""
+
+    def __init__(self) -> None:
+        """Init sampler."""
+        self.baseline = threading.active_count()
+        self.peak = self.baseline
+        self._task: asyncio.Task | None = None
+
+    async def _sample(self) -> None:
+        while True:
+            self.peak = max(self.peak, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    def __enter__(self) -> ThreadSampler:
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._task.cancel()
+
+
+async def bench(args: argparse.Namespace) -> None:
+    """Run every phase and print the report."""
+    from homeassistant.core import HomeAssistant
+
+    from custom_components.safety_signing.api import async_get_client
+    from custom_components.safety_signing.ratelimit import async_get_rate_limiter
+    from custom_components.safety_signing.token import Token
+
+    serials = [f"{index:032X}" for index in range(args.tokens)]
+    app = make_app(
+        FakeApiOptions(
+            latency=args.latency,
+            jitter=args.jitter,
+            failure_rate=args.failure_rate,
+            serials=serials,
+            documents=args.documents,
+        )
+    )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        socket_path = None
+        if args.unix:
+            socket_path = str(Path(config_dir) / "api.sock")
+            await web.UnixSite(runner, socket_path).start()
+        hass = HomeAssistant(config_dir)
+        client = async_get_client(
+            hass,
+            "127.0.0.1",
+            port=args.port,
+            max_requests=args.max_requests,
+            socket_path=socket_path,
+        )
+        # Off by default so that the numbers show the API, not the limiter
+        rate_limiter = async_get_rate_limiter(
+            hass, "127.0.0.1", rate=args.rate_limit, burst=args.rate_burst
+        )
+        tokens = [
+            Token(
+                hass, f"bench {index}", "127.0.0.1", {}, ["0100109106"],
+                f"BENCH{index:06d}", serial, dict(ACCESS_TOKEN), "123456",
+                "XHDO;THUE;BHXH;HSKHAC;HDLD;HDKT", client, split_apps=args.split_apps,
+                rate_limiter=rate_limiter,
+            )
+            for index, serial in enumerate(serials)
+        ]
+
+        async def timed(call) -> float:
+            start = time.perf_counter()
+            await call
+            return time.perf_counter() - start
+
+        with ThreadSampler() as info_threads:
+            start = time.perf_counter()
+            latencies = await asyncio.gather(
+                *(timed(token.check_serial_exists()) for token in tokens)
+            )
+            report("getInfo", latencies, time.perf_counter() - start)
+
+        async def trigger(cron) -> float | None:
+            start = time.perf_counter()
+            if (job := cron.schedule_run()) is None:
+                return None
+            await asyncio.shield(job.done)
+            return time.perf_counter() - start
+
+        with ThreadSampler() as sign_threads:
+            start = time.perf_counter()
+            results = await asyncio.gather(
+                *(
+                    trigger(cron)
+                    for _ in range(args.triggers)
+                    for token in tokens
+                    for cron in token.crons
+                ),
+                return_exceptions=True,
+            )
+            elapsed = time.perf_counter() - start
+        latencies = [result for result in results if isinstance(result, float)]
+        report("autoSign triggers", latencies, elapsed)
+
+        api = app["api"]
+        print(
+            f"dropped triggers: {len(results) - len(latencies)}, "
+            f"API requests: {dict(api.requests)}, "
+            f"max concurrent runs per token: {api.max_concurrent}"
+        )
+        print(
+            f"threads: baseline {info_threads.baseline}, "
+            f"peak getInfo {info_threads.peak}, peak autoSign {sign_threads.peak}"
+        )
+
+        await client.close()
+        await hass.async_stop(force=True)
+    await runner.cleanup()
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=10)
+    parser.add_argument("--triggers", type=int, default=3)
+    parser.add_argument("--port", type=int, default=3999)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--max-requests", type=int, default=8)
+    parser.add_argument("--split-apps", action="store_true")
+    parser.add_argument("--unix", action="store_true")
+    parser.add_argument("--rate-limit", type=float, default=0)
+    parser.add_argument("--rate-burst", type=int, default=10)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Fake SAFEcert signing API for local development and benchmarks.
+
+Serves the endpoints the integration talks to with configurable latency,
+failure rate and answer size, without a signing service or USB token:
+
+    python scripts/fake_api.py --port 3000 --latency 0.2 --failure-rate 0.05
+
+With --unix it also listens on a Unix socket, for entries with "api_socket".
+
+Every token serial is accepted, getInfo answers with the certs given by
+--serial (plus generated ones), autoSign answers with --documents records.
+An autoSign run fetches the documents of its apps one after the other, each
+taking --latency, then signs them through the single session of its token.
+Clients accepting application/x-ndjson get the answer as one line per document
+between a status line and a summary line. Every request carrying a PIN pays
+--login-time for the token login, requests carrying a session handle do not.
+With --pin any other PIN is refused, like a real token does.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+import random
+import secrets
+import time
+
+from aiohttp import web
+
+
+@dataclass
+class FakeApiOptions:
+    """Behaviour of the fake API."""
+
+    # Seconds every answer is delayed by, plus up to `jitter` more
+    latency: float = 0.05
+    jitter: float = 0.0
+    # Seconds the token session is held to sign the documents of one app
+    sign_time: float = 0.01
+    # Seconds of a PKCS#11 login, and seconds a session handle stays valid
+    login_time: float = 0.1
+    session_ttl: float = 600
+    # Serve /api/session/*, without it clients send the PIN with every request
+    sessions: bool = True
+    # PIN of every token, None accepts any
+    pin: str | None = None
+    # Share of requests answered with HTTP 503
+    failure_rate: float = 0.0
+    # Cert serials every token reports, getInfo always adds `extra_certs` random ones
+    serials: list[str] = field(default_factory=list)
+    extra_certs: int = 3
+    # Per-document records in an autoSign answer
+    documents: int = 10
+    # Serve the progress websocket and accept asynchronous autoSign runs
+    progress: bool = True
+
+
+class FakeApi:
+    """State of the fake API, kept for assertions and reports."""
+
+    def __init__(self, options: FakeApiOptions) -> None:
+        """Init fake API."""
+        self.options = options
+        self.requests: Counter[str] = Counter()
+        self.images: dict[str, str] = {}
+        self.signed: dict[str, dict] = {}
+        # Sessions open per token serial, `max_concurrent` must stay 1
+        self.active: Counter[str] = Counter()
+        self.max_concurrent = 0
+        self.sessions: dict[str, asyncio.Lock] = {}
+        # Expiry of every session handle handed out
+        self.handles: dict[str, float] = {}
+        self.running: dict[str, asyncio.Task] = {}
+        self.sockets: set[web.WebSocketResponse] = set()
+
+    async def _delay(self) -> None:
+        await asyncio.sleep(self.options.latency + random.uniform(0, self.options.jitter))
+
+    def _failing(self) -> bool:
+        return random.random() < self.options.failure_rate
+
+    async def health(self, request: web.Request) -> web.Response:
+        """Answer heartbeats."""
+        self.requests["health"] += 1
+        return web.json_response({"status": 0})
+
+    async def _login(self, credentials: dict) -> web.Response | None:
+        """Check the session or log in with the PIN, None when the request may go on."""
+        if (handle := credentials.get("session")) is not None:
+            if self.handles.get(handle, 0) < time.monotonic():
+                self.handles.pop(handle, None)
+                return web.json_response(
+                    {"status": 1, "error": "session_expired", "message": "Session expired"}
+                )
+            return None
+        self.requests["login"] += 1
+        await asyncio.sleep(self.options.login_time)
+        if self.options.pin is not None and credentials.get("pin") != self.options.pin:
+            return web.json_response({"status": 1, "message": "Wrong PIN"})
+        return None
+
+    async def open_session(self, request: web.Request) -> web.Response:
+        """Log in once and hand out a session handle."""
+        body = await request.json()
+        if (refused := await self._login({"pin": body.get("pin")})) is not None:
+            return refused
+        handle = secrets.token_hex(16)
+        self.handles[handle] = time.monotonic() + self.options.session_ttl
+        return web.json_response(
+            {"status": 0, "data": {"session": handle, "expires_in": self.options.session_ttl}}
+        )
+
+    async def close_session(self, request: web.Request) -> web.Response:
+        """Drop a session handle."""
+        body = await request.json()
+        self.handles.pop(body.get("session"), None)
+        return web.json_response({"status": 0})
+
+    async def get_info(self, request: web.Request) -> web.Response:
+        """Enumerate the certs of a token."""
+        self.requests["getInfo"] += 1
+        body = await request.json()
+        if (refused := await self._login(body)) is not None:
+            return refused
+        await self._delay()
+        if self._failing():
+            return web.json_response({"status": 1, "message": "busy"}, status=503)
+        certs = [{"SerialNumber": serial.upper()} for serial in self.options.serials]
+        certs += [
+            {"SerialNumber": f"{random.getrandbits(128):032X}"}
+            for _ in range(self.options.extra_certs)
+        ]
+        return web.json_response(
+            {"status": 0, "data": {"tokenSerial": body.get("token_serial"), "certs": certs}}
+        )
+
+    async def upload_image(self, request: web.Request) -> web.Response:
+        """Keep a stamp image under its hash."""
+        self.requests["image"] += 1
+        body = await request.json()
+        self.images[body["hash"]] = body["content"]
+        return web.json_response({"status": 0})
+
+    async def auto_sign(self, request: web.Request) -> web.Response:
+        """Pretend to sign every document of a run."""
+        self.requests["autoSign"] += 1
+        body = await request.json()
+        config = body["config"]
+        token_serial = config["token"]["tokenSerial"]
+        apps = json.loads(config["token"]["app"])
+        if (refused := await self._login(config["token"])) is not None:
+            return refused
+        key = request.headers.get("Idempotency-Key") or body.get("idempotency_key")
+        if key and key in self.signed:
+            self.requests["duplicate"] += 1
+            return await self._answer(request, self.signed[key])
+
+        image = config.get("pdf_options", {}).get("image", {})
+        if (digest := image.get("content_hash")) and digest not in self.images:
+            return web.json_response(
+                {"status": 1, "error": "image_not_found", "message": "Unknown image"}
+            )
+
+        if body.get("async") and self.options.progress and key:
+            # Answer right away, the run is reported on the progress websocket
+            if key not in self.running:
+                self.running[key] = asyncio.get_running_loop().create_task(
+                    self._run_async(key, token_serial, apps)
+                )
+            return web.json_response({"status": 0, "job_id": key})
+
+        answer = await self._sign(token_serial, apps)
+        if answer is None:
+            return web.json_response({"status": 1, "message": "busy"}, status=503)
+        if key:
+            self.signed[key] = answer
+        return await self._answer(request, answer)
+
+    async def _answer(self, request: web.Request, answer: dict) -> web.StreamResponse:
+        """Send an autoSign answer, streamed when the client accepts NDJSON."""
+        if "application/x-ndjson" not in request.headers.get("Accept", ""):
+            return web.json_response(answer)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        data = dict(answer.get("data") or {})
+        documents = data.pop("documents", [])
+        await response.write(
+            json.dumps({"status": answer["status"], "message": answer["message"]}).encode() + b"\n"
+        )
+        for document in documents:
+            await response.write(json.dumps({"document": document}).encode() + b"\n")
+        await response.write(json.dumps({"data": data}).encode() + b"\n")
+        await response.write_eof()
+        return response
+
+    async def _sign(self, token_serial: str, apps: list[str]) -> dict | None:
+        """Sign a run, None when it fails with the configured failure rate."""
+        for _app in apps:
+            await self._delay()
+        async with self.sessions.setdefault(token_serial, asyncio.Lock()):
+            self.active[token_serial] += 1
+            self.max_concurrent = max(self.max_concurrent, self.active[token_serial])
+            try:
+                await asyncio.sleep(self.options.sign_time * len(apps))
+            finally:
+                self.active[token_serial] -= 1
+        if self._failing():
+            return None
+        return {
+            "status": 0,
+            "message": "OK",
+            "data": {
+                "signed": self.options.documents,
+                "failed": 0,
+                "documents": [
+                    {"id": index, "status": "signed", "signedAt": time.time()}
+                    for index in range(self.options.documents)
+                ],
+            },
+        }
+
+    async def _broadcast(self, event: dict) -> None:
+        for ws in list(self.sockets):
+            try:
+                await ws.send_json(event)
+            except ConnectionResetError:
+                self.sockets.discard(ws)
+
+    async def _run_async(self, key: str, token_serial: str, apps: list[str]) -> None:
+        """Sign a run and push its progress."""
+        try:
+            await self._broadcast(
+                {"job_id": key, "event": "found", "count": self.options.documents}
+            )
+            answer = await self._sign(token_serial, apps)
+            if answer is None:
+                answer = {"status": 1, "message": "busy"}
+            else:
+                for document in answer["data"]["documents"]:
+                    await self._broadcast({"job_id": key, "event": "signed", "document": document})
+                self.signed[key] = answer
+                # The documents were pushed one by one, the result only sums them up
+                data = {k: v for k, v in answer["data"].items() if k != "documents"}
+                answer = {**answer, "data": data}
+            await self._broadcast({"job_id": key, "event": "done", "result": answer})
+        finally:
+            del self.running[key]
+
+    async def progress(self, request: web.Request) -> web.WebSocketResponse:
+        """Push job progress events until the client goes away."""
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.sockets.add(ws)
+        try:
+            async for _message in ws:
+                pass
+        finally:
+            self.sockets.discard(ws)
+        return ws
+
+
+def make_app(options: FakeApiOptions) -> web.Application:
+    """Return the aiohttp application of a fake API, state in app["api"]."""
+    api = FakeApi(options)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["api"] = api
+    app.router.add_get("/api/health", api.health)
+    app.router.add_post("/api/token/getInfo", api.get_info)
+    app.router.add_post("/api/image/upload", api.upload_image)
+    app.router.add_post("/api/autoSign", api.auto_sign)
+    if options.progress:
+        app.router.add_get("/api/progress", api.progress)
+    if options.sessions:
+        app.router.add_post("/api/session/open", api.open_session)
+        app.router.add_post("/api/session/close", api.close_session)
+    return app
+
+
+def main() -> None:
+    """Run the fake API until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--unix", help="also serve on this Unix socket path")
+    parser.add_argument("--latency", type=float, default=FakeApiOptions.latency)
+    parser.add_argument("--jitter", type=float, default=FakeApiOptions.jitter)
+    parser.add_argument("--sign-time", type=float, default=FakeApiOptions.sign_time)
+    parser.add_argument("--failure-rate", type=float, default=FakeApiOptions.failure_rate)
+    parser.add_argument("--serial", action="append", default=[], dest="serials")
+    parser.add_argument("--extra-certs", type=int, default=FakeApiOptions.extra_certs)
+    parser.add_argument("--documents", type=int, default=FakeApiOptions.documents)
+    parser.add_argument("--login-time", type=float, default=FakeApiOptions.login_time)
+    parser.add_argument("--session-ttl", type=float, default=FakeApiOptions.session_ttl)
+    parser.add_argument("--no-progress", action="store_false", dest="progress")
+    parser.add_argument("--no-sessions", action="store_false", dest="sessions")
+    parser.add_argument("--pin")
+    args = parser.parse_args()
+    options = FakeApiOptions(
+        latency=args.latency,
+        jitter=args.jitter,
+        sign_time=args.sign_time,
+        failure_rate=args.failure_rate,
+        serials=args.serials,
+        extra_certs=args.extra_certs,
+        documents=args.documents,
+        progress=args.progress,
+        login_time=args.login_time,
+        session_ttl=args.session_ttl,
+        sessions=args.sessions,
+        pin=args.pin,
+    )
+    web.run_app(make_app(options), host=args.host, port=args.port, path=args.unix)
+
+
+if __name__ == "__main__":
+    main()
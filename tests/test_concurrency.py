@@ -0,0 +1,326 @@
+"""Scheduler, breaker, retry, sessions, offline replay and timer wheel against the fake API.
+
+The fake API of scripts/fake_api.py runs in process. Needs Home Assistant installed,
+like scripts/bench.py, it does not need a running instance:
+
+    pip install homeassistant pytest
+    python -m pytest tests
+"""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from functools import wraps
+from pathlib import Path
+import socket
+from types import SimpleNamespace
+
+from aiohttp import web
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from custom_components.safety_signing.api import (  # noqa: E402
+    ApiBusyError,
+    ApiClient,
+    ApiConnectionError,
+    ApiLoginError,
+    ApiResponseError,
+    ApiUnavailableError,
+)
+from custom_components.safety_signing.offline import OfflineQueue  # noqa: E402
+from custom_components.safety_signing.ratelimit import RateLimiter  # noqa: E402
+from custom_components.safety_signing.retry import RetryPolicy  # noqa: E402
+from custom_components.safety_signing.schedule import Schedule, TimerWheel  # noqa: E402
+from custom_components.safety_signing.token import Token  # noqa: E402
+from fake_api import FakeApiOptions, make_app  # noqa: E402
+
+ACCESS_TOKEN = {
+    "access_token": "test",
+    "expires_in": 3599,
+    "scope": "https://www.googleapis.com/auth/drive",
+    "token_type": "Bearer",
+}
+CERT = "540101082128FB12C8B5F47248A2ABD3"
+
+
+def async_test(func: Callable[..., Awaitable[None]]) -> Callable[..., None]:
+    """Run an async test on a loop of its own, no pytest plugin needed."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs) -> None:
+        asyncio.run(func(*args, **kwargs))
+
+    return wrapper
+
+
+def free_port() -> int:
+    """Return a local port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def fake_api(
+    tmp_path: Path, serve: bool = True, **options
+) -> AsyncIterator[SimpleNamespace]:
+    """Yield a fake API, a bare HA core and a client, all torn down afterwards.
+
+    Without `serve` nothing listens on the port until `env.serve()` is awaited.
+    """
+    options = {"latency": 0, "sign_time": 0, "login_time": 0, "progress": False, **options}
+    app = make_app(FakeApiOptions(serials=[CERT], **options))
+    app.router.add_post("/api/broken", broken)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+
+    async def serve_api() -> None:
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    if serve:
+        await serve_api()
+    hass = HomeAssistant(str(tmp_path))
+    client = ApiClient("127.0.0.1", port)
+    try:
+        yield SimpleNamespace(api=app["api"], hass=hass, client=client, serve=serve_api)
+    finally:
+        await client.close()
+        await hass.async_stop(force=True)
+        await runner.cleanup()
+
+
+async def broken(request: web.Request) -> web.Response:
+    """Answer like a crashed API behind a proxy."""
+    request.app["api"].requests["broken"] += 1
+    return web.Response(status=500, text="<html>Internal error</html>", content_type="text/html")
+
+
+def make_token(env: SimpleNamespace, app: str = "XHDO", name: str = "test", **kwargs) -> Token:
+    """Return a token of the fake API, retries without delay, no rate limit."""
+    kwargs.setdefault("retry_policy", RetryPolicy(attempts=3, base_delay=0, max_delay=0))
+    kwargs.setdefault("rate_limiter", RateLimiter(rate=0))
+    token = Token(
+        env.hass, name, "127.0.0.1", {}, ["0100109106"], "54071505112731", CERT,
+        dict(ACCESS_TOKEN), "123456", app, env.client, **kwargs,
+    )
+    token._is_valid_token = True
+    return token
+
+
+@async_test
+async def test_scheduler_merges_waiting_triggers(tmp_path: Path) -> None:
+    """Triggers arriving while a run is in progress make a single follow-up run."""
+    async with fake_api(tmp_path, latency=0.1) as env:
+        cron = make_token(env).crons[0]
+        first = cron.schedule_run()
+        await asyncio.sleep(0.05)
+        follow_ups = [cron.schedule_run() for _ in range(3)]
+
+        assert all(job is follow_ups[0] for job in follow_ups)
+        assert follow_ups[0].triggers == 3
+        await asyncio.wait({first.done, follow_ups[0].done})
+        assert env.api.requests["autoSign"] == 2
+        assert env.api.max_concurrent == 1
+        assert not cron.is_running
+
+
+@async_test
+async def test_breaker_fails_fast_while_api_down(tmp_path: Path) -> None:
+    """Once enough requests failed, the next ones are refused without connecting."""
+    async with fake_api(tmp_path, serve=False) as env:
+        for _ in range(3):
+            with pytest.raises(ApiConnectionError):
+                await env.client.post("/api/token/getInfo", {})
+        assert not env.client.available
+        with pytest.raises(ApiUnavailableError):
+            await env.client.post("/api/token/getInfo", {})
+
+
+@async_test
+async def test_retry_busy_answers_only(tmp_path: Path) -> None:
+    """Busy answers are retried, error answers are final."""
+    async with fake_api(tmp_path, failure_rate=1.0) as env:
+        policy = RetryPolicy(attempts=3, base_delay=0, max_delay=0)
+        with pytest.raises(ApiBusyError):
+            await policy.async_call(env.client.post, "/api/token/getInfo", {"pin": "123456"})
+        assert env.api.requests["getInfo"] == 3
+
+        with pytest.raises(ApiResponseError):
+            await policy.async_call(env.client.post, "/api/broken", {})
+        assert env.api.requests["broken"] == 1
+
+
+@async_test
+async def test_session_opened_once_for_concurrent_callers(tmp_path: Path) -> None:
+    """Concurrent requests of a token share one login."""
+    async with fake_api(tmp_path, login_time=0.05) as env:
+        token = make_token(env)
+        handles = await asyncio.gather(*(token._session.async_get() for _ in range(5)))
+
+        assert len(set(handles)) == 1 and handles[0] is not None
+        assert env.api.requests["login"] == 1
+        await token.async_close()
+
+
+@async_test
+async def test_entries_on_one_token_share_the_session(tmp_path: Path) -> None:
+    """Tokens of two entries on the same token serial log in once, out with the last."""
+    async with fake_api(tmp_path) as env:
+        first, second = make_token(env, name="first"), make_token(env, name="second")
+
+        await first.crons[0].running_cron()
+        await second.crons[0].running_cron()
+        assert first._session is second._session
+        assert env.api.requests["login"] == 1
+
+        await first.async_close()
+        assert len(env.api.handles) == 1
+        await second.async_close()
+        assert env.api.handles == {}
+
+
+@async_test
+async def test_session_open_takes_a_rate_limit_slot(tmp_path: Path) -> None:
+    """Logging in goes through the rate limiter of the host like any request."""
+    async with fake_api(tmp_path) as env:
+        limiter = RateLimiter(rate=0.001, burst=1)
+        token = make_token(env, rate_limiter=limiter)
+
+        await token._session.async_get()
+
+        assert env.api.requests["login"] == 1
+        assert limiter._tokens < 0.5
+        await token.async_close()
+
+
+@async_test
+async def test_empty_session_answer_is_an_api_error(tmp_path: Path) -> None:
+    """A session answer without a body fails as an error answer."""
+    async with fake_api(tmp_path) as env:
+        token = make_token(env)
+
+        async def empty(*_args, **_kwargs) -> None:
+            return None
+
+        env.client.post = empty
+        with pytest.raises(ApiResponseError):
+            await token._session.async_get()
+
+
+@async_test
+async def test_refused_login_is_final(tmp_path: Path) -> None:
+    """A wrong PIN is tried once, and the run is neither retried nor queued."""
+    async with fake_api(tmp_path, pin="999999") as env:
+        queue = OfflineQueue(env.hass)
+        await queue.async_load()
+        token = make_token(env, offline_queue=queue)
+
+        await token.crons[0].running_cron()
+
+        assert env.api.requests["login"] == 1
+        assert env.api.requests["autoSign"] == 0
+        assert token.metrics.failures == {"login": 1}
+        assert queue.jobs(token._token_serial) == []
+        with pytest.raises(ApiLoginError):
+            await token._session.async_get()
+
+
+@async_test
+async def test_setup_trusts_the_info_of_the_flow(tmp_path: Path) -> None:
+    """The getInfo answer of the config flow is reused by the setup revalidation."""
+    async with fake_api(tmp_path) as env:
+        flow_token = make_token(env)
+        assert await flow_token.check_serial_exists()
+        await flow_token.async_close()
+        token = make_token(env)
+
+        assert await token.async_revalidate()
+        assert env.api.requests["getInfo"] == 1
+        await token.async_close()
+
+
+@async_test
+async def test_split_apps_share_the_session(tmp_path: Path) -> None:
+    """A split run signs every app in its own request over a single login."""
+    async with fake_api(tmp_path) as env:
+        token = make_token(env, app="XHDO;THUE;BHXH", split_apps=True)
+
+        await token.crons[0].running_cron()
+
+        assert env.api.requests["autoSign"] == 3
+        assert env.api.requests["login"] == 1
+        assert env.api.max_concurrent == 1
+        assert token.metrics.successes == 1
+        assert token.metrics.documents["signed"] == 3 * FakeApiOptions.documents
+        await token.async_close()
+
+
+@async_test
+async def test_offline_run_replayed_once_api_is_back(tmp_path: Path) -> None:
+    """A run that could not reach the API is replayed under the same key."""
+    async with fake_api(tmp_path, serve=False, sessions=False) as env:
+        queue = OfflineQueue(env.hass)
+        await queue.async_load()
+        token = make_token(env, offline_queue=queue, retry_policy=RetryPolicy(attempts=1))
+        cron = token.crons[0]
+
+        job = cron.schedule_run()
+        await asyncio.wait({job.done})
+        (pending,) = queue.jobs(token._token_serial)
+        assert token.metrics.failures == {"connection": 1}
+
+        await env.serve()
+        await token.async_replay()
+
+        assert queue.jobs(token._token_serial) == []
+        assert env.api.requests["autoSign"] == 1
+        assert pending["run_id"] in env.api.signed
+
+
+@async_test
+async def test_replay_keeps_the_runs_of_other_entries(tmp_path: Path) -> None:
+    """Entries on the same token serial each replay their own queued runs."""
+    async with fake_api(tmp_path, serve=False, sessions=False) as env:
+        queue = OfflineQueue(env.hass)
+        await queue.async_load()
+        first, second = (
+            make_token(env, name=name, offline_queue=queue, retry_policy=RetryPolicy(attempts=1))
+            for name in ("first", "second")
+        )
+        for token in (first, second):
+            await asyncio.wait({token.crons[0].schedule_run().done})
+        assert len(queue.jobs(first._token_serial)) == 2
+
+        await env.serve()
+        await first.async_replay()
+
+        (waiting,) = queue.jobs(first._token_serial)
+        assert waiting["cron_id"] == second.crons[0].cron_id
+        await second.async_replay()
+        assert queue.jobs(first._token_serial) == []
+        assert env.api.requests["autoSign"] == 2
+
+
+@async_test
+async def test_timer_wheel_fires_every_schedule(tmp_path: Path) -> None:
+    """One loop timer drives every schedule until it is removed."""
+    hass = HomeAssistant(str(tmp_path))
+    wheel = TimerWheel(hass)
+    fired: list[str] = []
+    remove_a = wheel.async_schedule("a", Schedule(interval=0.05), lambda: fired.append("a"))
+    wheel.async_schedule("b", Schedule(interval=0.08, offset=0.01), lambda: fired.append("b"))
+
+    await asyncio.sleep(0.3)
+    remove_a()
+    count_a = fired.count("a")
+    await asyncio.sleep(0.2)
+
+    assert count_a >= 3 and fired.count("a") == count_a
+    assert fired.count("b") >= 4
+    wheel.async_stop()
+    await hass.async_stop(force=True)
@@ -0,0 +1,53 @@
+"""Stamp images moved out of the entries and cleaned up once unused."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from custom_components.safety_signing.const import IMAGE_HASH  # noqa: E402
+from custom_components.safety_signing.image_store import ImageStore  # noqa: E402
+from test_concurrency import async_test  # noqa: E402
+
+
+@async_test
+async def test_image_moved_only_once_stored(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """The inline content is dropped for the hash only when the store holds it."""
+    hass = HomeAssistant(str(tmp_path))
+    store = ImageStore(hass)
+    image = {"content": "iVBORw0KGgo="}
+
+    assert await store.async_move(image)
+    assert image == {IMAGE_HASH: ImageStore.digest("iVBORw0KGgo=")}
+    assert await store.async_get(image[IMAGE_HASH]) == "iVBORw0KGgo="
+
+    def fail(*_args) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(store, "_write", fail)
+    kept = {"content": "R0lGODlh"}
+    assert not await store.async_move(kept)
+    assert kept == {"content": "R0lGODlh"}
+    await hass.async_stop(force=True)
+
+
+@async_test
+async def test_unused_images_removed_after_grace(tmp_path: Path) -> None:
+    """Images no entry uses are deleted, unless stored moments ago."""
+    hass = HomeAssistant(str(tmp_path))
+    store = ImageStore(hass)
+    used, old, new = [await store.async_put(content) for content in ("a", "b", "c")]
+    for digest in (used, old):
+        os.utime(store._path / digest, (0, 0))
+
+    await store.async_remove_unused({used})
+
+    assert sorted(path.name for path in store._path.iterdir()) == sorted([used, new])
+    await hass.async_stop(force=True)
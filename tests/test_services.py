@@ -0,0 +1,63 @@
+"""Services called through the service registry, like an automation calls them."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from custom_components.safety_signing.const import (  # noqa: E402
+    DOMAIN,
+    SERVICE_GET_HISTORY,
+    SERVICE_PROFILE,
+)
+from custom_components.safety_signing.history import async_get_history  # noqa: E402
+from custom_components.safety_signing.services import async_setup_services  # noqa: E402
+from test_concurrency import async_test, fake_api, make_token  # noqa: E402
+
+
+@async_test
+async def test_get_history_pages_the_runs(tmp_path: Path) -> None:
+    """The runs are answered newest first, with the cursor of the next page."""
+    async with fake_api(tmp_path) as env:
+        async_setup_services(env.hass)
+        token = make_token(env, history=async_get_history(env.hass))
+        for _ in range(2):
+            await token.crons[0].running_cron()
+
+        first = await env.hass.services.async_call(
+            DOMAIN, SERVICE_GET_HISTORY, {"limit": 1, "documents": False},
+            blocking=True, return_response=True,
+        )
+        (newest,) = first["runs"]
+        assert newest["success"] and first["next_cursor"] == newest["id"]
+
+        second = await env.hass.services.async_call(
+            DOMAIN, SERVICE_GET_HISTORY,
+            {"limit": 1, "documents": False, "cursor": first["next_cursor"]},
+            blocking=True, return_response=True,
+        )
+        assert [run["id"] for run in second["runs"]] == [newest["id"] - 1]
+        assert second["next_cursor"] is None
+        await async_get_history(env.hass).async_close()
+        await token.async_close()
+
+
+@async_test
+async def test_profile_writes_to_the_config_dir(tmp_path: Path) -> None:
+    """A profile answers the path of the file it wrote."""
+    hass = HomeAssistant(str(tmp_path))
+    async_setup_services(hass)
+
+    response = await hass.services.async_call(
+        DOMAIN, SERVICE_PROFILE, {"mode": "deterministic", "duration": 1},
+        blocking=True, return_response=True,
+    )
+
+    path = Path(response["path"])
+    assert path.parent == tmp_path and path.suffix == ".prof"
+    assert path.stat().st_size > 0
+    await hass.async_stop(force=True)